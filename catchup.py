@@ -0,0 +1,295 @@
+"""
+Catch-up: advance a world by many ticks without running each one.
+
+A tick is fully determined by the chest stock, and each producer's choice
+of chest comes down to comparisons of the form `stock[c] >= need`. Once
+the economy settles into a cycle, where the same producers pick the same
+chests every p ticks, each cycle adds a fixed delta to the stock. Along a
+run of repeated cycles every compared value then moves linearly, so a
+comparison can only flip at a cycle count that can be computed up front.
+advance() runs real ticks until it sees a cycle, skips every repeat of it
+that is known to change no comparison, and goes back to real ticks right
+before the first gate that would flip.
+
+    python catchup.py --sizes 50 100 --ticks 5000
+
+checks advance() against the same number of plain simulate_tick calls on
+every generator's world, with empty and with pre-stocked chests, and
+prints both timings. Every run is checked even after a mismatch, and the
+exit status is 1 if any of them diverged, so the check can gate CI.
+"""
+
+import argparse
+import random
+import sys
+import time
+from array import array
+from typing import Callable, Dict, List, Optional, Tuple
+
+import mapgen
+import world
+
+# Longest cycle looked for, in ticks
+MAX_PERIOD = 32
+# Traced ticks without finding a cycle before backing off to plain ticks,
+# which are cheaper; the plain stretch doubles each time up to MAX_BACKOFF
+DETECT_TICKS = 4 * MAX_PERIOD
+MAX_BACKOFF = 4096
+
+# (inputs as (resource index, amount), outputs likewise, chest offsets)
+Step = Tuple[List[Tuple[int, int]], List[Tuple[int, int]], List[int]]
+
+
+def build_steps(world_grid) -> List[Step]:
+    """
+    Every producer with a reachable chest, in tick order.
+    """
+    return [
+        world.recipe(bid, lvl) + (offs,)
+        for _, _, bid, lvl, offs in world.producer_links(world_grid)
+    ]
+
+
+class Trace:
+    """
+    What one traced tick decided and how close each compared counter came
+    to flipping its comparison.
+    """
+
+    def __init__(self):
+        self.choices: tuple = ()
+        # counter offset -> smallest stock - need over comparisons that held
+        self.slack: Dict[int, int] = {}
+        # counter offset -> smallest need - stock over comparisons that failed
+        self.deficit: Dict[int, int] = {}
+
+
+def traced_tick(steps: List[Step], stock, totals) -> Trace:
+    """
+    One tick with the same outcome as world.simulate_tick, recording every
+    comparison it depends on. Every input of every chest tried is compared,
+    even past the first one that fails; that can only make the recorded
+    bounds tighter.
+    """
+    trace = Trace()
+    slack, deficit = trace.slack, trace.deficit
+    choices = []
+    for ins, outs, offs in steps:
+        chosen = -1
+        for k, base in enumerate(offs):
+            ok = True
+            for r, need in ins:
+                c = base + r
+                v = stock[c] - need
+                if v >= 0:
+                    if v < slack.get(c, v + 1):
+                        slack[c] = v
+                else:
+                    ok = False
+                    if -v < deficit.get(c, 1 - v):
+                        deficit[c] = -v
+            if ok:
+                for r, need in ins:
+                    stock[base + r] -= need
+                    totals[r] -= need
+                for r, amount in outs:
+                    stock[base + r] += amount
+                    totals[r] += amount
+                chosen = k
+                break
+        choices.append(chosen)
+    trace.choices = tuple(choices)
+    return trace
+
+
+def safe_repeats(traces: List[Trace], delta: Dict[int, int], limit: int) -> int:
+    """
+    How many more times (up to limit) the cycle recorded in `traces` can
+    repeat with `delta` added to the stock each time before any of its
+    comparisons could come out differently.
+    """
+    k = limit
+    for trace in traces:
+        for c, s in trace.slack.items():
+            d = delta.get(c, 0)
+            if d < 0:
+                k = min(k, s // -d)
+        for c, s in trace.deficit.items():
+            d = delta.get(c, 0)
+            if d > 0:
+                k = min(k, (s - 1) // d)
+        if k <= 0:
+            return 0
+    return k
+
+
+class CatchUp:
+    """
+    Drives advance() for one grid; keeps the cycle search state between
+    calls so repeated short advances still find long cycles.
+    """
+
+    def __init__(self, world_grid, tick: Callable = world.simulate_tick):
+        self.grid = world_grid
+        self.tick = tick
+        self._version = None
+        self._steps: List[Step] = []
+        self._backoff = DETECT_TICKS
+        self._reset()
+
+    def _reset(self):
+        # newest last: traces of the last ticks and the state before each
+        self._traces: List[Trace] = []
+        self._stocks: List[array] = []
+        self._totals: List[List[int]] = []
+        self._traced = 0
+
+    def _period(self) -> Optional[int]:
+        traces = self._traces
+        for p in range(1, len(traces) // 2 + 1):
+            if all(
+                traces[-1 - i].choices == traces[-1 - i - p].choices for i in range(p)
+            ):
+                return p
+        return None
+
+    def _jump(self, p: int, cycles: int) -> int:
+        """
+        Skip up to `cycles` repeats of the last p ticks; returns how many.
+        """
+        stock, totals = self.grid.stock, self.grid.ledger.stock
+        before = self._stocks[-p]
+        delta = {c: v - before[c] for c, v in enumerate(stock) if v != before[c]}
+        k = safe_repeats(self._traces[-p:], delta, cycles)
+        if k <= 0:
+            return 0
+        for c, d in delta.items():
+            stock[c] += k * d
+        for r, (now, then) in enumerate(zip(totals, self._totals[-p])):
+            totals[r] += k * (now - then)
+        return k
+
+    def advance(self, n: int):
+        g = self.grid
+        while n > 0:
+            if g.version != self._version:
+                self._steps = build_steps(g)
+                self._version = g.version
+                self._backoff = DETECT_TICKS
+                self._reset()
+            if self._traced >= DETECT_TICKS:
+                # no cycle in sight: run plain ticks for a while
+                if hasattr(self.tick, "reset"):
+                    # the traced ticks moved stock behind its back
+                    self.tick.reset()
+                for _ in range(min(n, self._backoff)):
+                    self.tick(g)
+                n -= min(n, self._backoff)
+                self._backoff = min(self._backoff * 2, MAX_BACKOFF)
+                self._reset()
+                continue
+
+            self._stocks.append(array("q", g.stock))
+            self._totals.append(list(g.ledger.stock))
+            self._traces.append(traced_tick(self._steps, g.stock, g.ledger.stock))
+            self._traced += 1
+            n -= 1
+            if len(self._traces) > 2 * MAX_PERIOD:
+                del self._traces[0], self._stocks[0], self._totals[0]
+
+            p = self._period()
+            if p is not None and n >= p:
+                k = self._jump(p, n // p)
+                if k:
+                    n -= k * p
+                    self._backoff = DETECT_TICKS
+                    self._reset()
+
+
+def advance(world_grid, n: int, tick: Callable = world.simulate_tick):
+    """
+    Same effect as calling tick(world_grid) n times. `tick` runs the ticks
+    that can't be skipped and must match world.simulate_tick.
+    """
+    CatchUp(world_grid, tick).advance(n)
+
+
+def generate(scenario: str, size: int, seed: int, fill: int):
+    """
+    A generated world with every chest counter stocked with up to `fill`
+    units, so draining chests flip gates as well as filling ones.
+    """
+    g = mapgen.GENERATORS[scenario](size, size, seed)
+    rng = random.Random(seed)
+    for c in range(len(g.stock)):
+        amount = rng.randrange(fill + 1)
+        g.stock[c] += amount
+        g.ledger.stock[c % world.NUM_RESOURCES] += amount
+    return g
+
+
+def check(
+    scenario: str, size: int, ticks: int, seed: int = 0, split: int = 1, fill: int = 0
+):
+    """
+    Differential check: advance() in `split` pieces against plain ticks on
+    two copies of the same generated world. Returns both durations (s).
+    """
+    a = generate(scenario, size, seed, fill)
+    b = generate(scenario, size, seed, fill)
+    t0 = time.perf_counter()
+    catchup = CatchUp(a)
+    for i in range(split):
+        catchup.advance(ticks * (i + 1) // split - ticks * i // split)
+    fast = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for _ in range(ticks):
+        world.simulate_tick(b)
+    slow = time.perf_counter() - t0
+    if a.stock != b.stock or a.ledger.stock != b.ledger.stock:
+        bad = next(c for c, (u, v) in enumerate(zip(a.stock, b.stock)) if u != v)
+        raise AssertionError(
+            f"{scenario} {size}: counter {bad} is {a.stock[bad]} after advance, "
+            f"{b.stock[bad]} after {ticks} ticks"
+        )
+    return fast, slow
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scenarios", nargs="+", default=list(mapgen.GENERATORS))
+    parser.add_argument("--sizes", nargs="+", type=int, default=[20, 50])
+    parser.add_argument("--ticks", type=int, default=2000)
+    parser.add_argument("--seeds", nargs="+", type=int, default=[0, 1])
+    parser.add_argument("--split", type=int, default=3)
+    parser.add_argument("--fill", nargs="+", type=int, default=[0, 500])
+    args = parser.parse_args(argv)
+
+    print(
+        f"{'scenario':<8} {'size':>5} {'seed':>4} {'fill':>5} "
+        f"{'advance_s':>10} {'ticks_s':>8}"
+    )
+    mismatches = []
+    for scenario in args.scenarios:
+        for size in args.sizes:
+            for seed in args.seeds:
+                for fill in args.fill:
+                    row = f"{scenario:<8} {size:>5} {seed:>4} {fill:>5} "
+                    try:
+                        fast, slow = check(
+                            scenario, size, args.ticks, seed, args.split, fill
+                        )
+                    except AssertionError as e:
+                        mismatches.append(f"{row.rstrip()}: {e}")
+                        print(row + "MISMATCH", flush=True)
+                        continue
+                    print(row + f"{fast:>10.3f} {slow:>8.3f}", flush=True)
+    for line in mismatches:
+        print("MISMATCH " + line)
+    if not mismatches:
+        print("advance() matched every run")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,44 @@
 # Map dimensions
 MAP_WIDTH = 7
 MAP_HEIGHT = 7
+CHUNK_SIZE = 32  # cells per chunk side; chunks are allocated on first write
 
 # Sidebar UI
 PANEL_WIDTH = 200
 PANEL_PADDING = 10
 ICON_SIZE = 40
+TEXT_CACHE_SIZE = 256
+FONT_NAME = None  # system font name; None is pygame's bundled font
+FONT_SIZE = 24
+FONT_CACHE_PATH = "bananarchy.fonts.json"  # resolved system font paths
 
 # Tile appearance
 TILE_MARGIN_RATIO = 0.1
+TEXTURE_DIR = "textures"  # optional PNGs; see texture.py
+
+# Camera
+MIN_TILE_WIDTH = 8
+MAX_TILE_WIDTH = 256
+ZOOM_STEP = 1.1
+PAN_SPEED = 12
+
+# Simulation
+TICK_INTERVAL = 2.0  # seconds per tick at 1x
+SIM_SPEEDS = [1, 10, 0]  # keys 1-3; 0 runs ticks as fast as possible
+SNAPSHOT_HZ = 60
+MAX_FILL_CELLS = 65536  # largest region one flood fill may change
+
+# Saving
+SAVE_PATH = "bananarchy.sav"
+AUTOSAVE_INTERVAL = 30.0  # seconds between journal flushes
+JOURNAL_MAX_RECORDS = 65536  # past either limit, write a fresh snapshot
+JOURNAL_MAX_TICKS = 1000
+
+# Profiling (F3 toggles the overlay, F4 writes a Chrome trace)
+TRACE_PATH = "bananarchy_trace.json"
+
+# Session recording (F5 starts and stops; replay with recording.py)
+RECORD_PATH = "bananarchy.rec"
 
 # Colors
 COLORS = {
@@ -0,0 +1,159 @@
+"""
+Headless simulation runner and benchmark suite.
+
+    python headless.py --sizes 100 250 500 --ticks 200 --engine batch
+
+Builds each generator's world at each size, runs ticks back to back and
+prints ticks/sec, per-tick latency percentiles and peak memory.
+"""
+
+import argparse
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import Callable, List
+
+import mapgen
+import profiler
+import world
+
+
+@dataclass
+class RunStats:
+    scenario: str
+    size: int
+    engine: str
+    ticks: int
+    build_s: float
+    ticks_per_s: float
+    p50_ms: float
+    p90_ms: float
+    p99_ms: float
+    peak_mb: float
+
+
+def get_engine(name: str) -> Callable:
+    if name == "batch":
+        import batch
+
+        return batch.simulate_tick
+    if name == "parallel":
+        import parallel
+
+        return parallel.ParallelTicker()
+    if name == "events":
+        import scheduler
+
+        return scheduler.EventTicker()
+    return world.simulate_tick
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    k = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[k]
+
+
+def run_ticks(world_grid, n: int, tick: Callable = world.simulate_tick) -> List[float]:
+    """
+    Run n ticks as fast as possible and return each tick's duration (s).
+    """
+    times = []
+    clock = time.perf_counter
+    for _ in range(n):
+        t0 = clock()
+        with profiler.scope("tick"):
+            tick(world_grid)
+        times.append(clock() - t0)
+    return times
+
+
+def peak_memory(scenario: str, size: int, seed: int, tick: Callable) -> float:
+    """
+    Peak traced allocation (MB) for building the world plus one tick.
+    Measured in its own pass since tracemalloc slows everything down.
+    """
+    tracemalloc.start()
+    try:
+        g = mapgen.GENERATORS[scenario](size, size, seed)
+        tick(g)
+        return tracemalloc.get_traced_memory()[1] / 2**20
+    finally:
+        tracemalloc.stop()
+
+
+def bench(
+    scenario: str, size: int, ticks: int, engine: str = "serial", seed: int = 0
+) -> RunStats:
+    tick = get_engine(engine)
+    try:
+        t0 = time.perf_counter()
+        g = mapgen.GENERATORS[scenario](size, size, seed)
+        build_s = time.perf_counter() - t0
+        tick(g)  # warm up derived caches outside the timed run
+        times = run_ticks(g, ticks, tick)
+        peak_mb = peak_memory(scenario, size, seed, tick)
+    finally:
+        if hasattr(tick, "close"):
+            tick.close()
+    total = sum(times)
+    return RunStats(
+        scenario,
+        size,
+        engine,
+        ticks,
+        build_s,
+        ticks / total if total else float("inf"),
+        percentile(times, 50) * 1000,
+        percentile(times, 90) * 1000,
+        percentile(times, 99) * 1000,
+        peak_mb,
+    )
+
+
+def format_row(s: RunStats) -> str:
+    return (
+        f"{s.scenario:<8} {s.size:>5} {s.engine:<7} {s.ticks:>6} "
+        f"{s.build_s:>8.2f} {s.ticks_per_s:>10.1f} "
+        f"{s.p50_ms:>8.3f} {s.p90_ms:>8.3f} {s.p99_ms:>8.3f} {s.peak_mb:>8.1f}"
+    )
+
+
+HEADER = (
+    f"{'scenario':<8} {'size':>5} {'engine':<7} {'ticks':>6} "
+    f"{'build_s':>8} {'ticks/s':>10} "
+    f"{'p50_ms':>8} {'p90_ms':>8} {'p99_ms':>8} {'peak_mb':>8}"
+)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scenarios", nargs="+", default=list(mapgen.GENERATORS))
+    parser.add_argument("--sizes", nargs="+", type=int, default=[50, 100, 200])
+    parser.add_argument("--ticks", type=int, default=100)
+    parser.add_argument(
+        "--engine", choices=["serial", "batch", "parallel", "events"], default="serial"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--trace",
+        metavar="PATH",
+        help="profile tick phases and write a Chrome trace (slows the ticks)",
+    )
+    args = parser.parse_args(argv)
+
+    profiler.set_enabled(bool(args.trace))
+    print(HEADER)
+    for scenario in args.scenarios:
+        for size in args.sizes:
+            with profiler.scope(f"{scenario} {size}"):
+                stats = bench(scenario, size, args.ticks, args.engine, args.seed)
+            print(format_row(stats), flush=True)
+    if args.trace:
+        profiler.export(args.trace)
+
+
+if __name__ == "__main__":
+    main()
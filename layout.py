@@ -0,0 +1,96 @@
+"""
+Stacked panel layout with cached hit-testing.
+
+A Column is built once whenever the window size or the panel's content
+changes: items are added top to bottom and get their rectangles there
+and then. Drawing and click handling both read those rectangles, so
+neither repeats the layout arithmetic. Items added after begin_scroll()
+move with the column's scroll offset and are only drawn inside the area
+below the fixed ones.
+"""
+
+import bisect
+from dataclasses import dataclass
+from typing import Any, Iterator, List, Optional, Tuple
+
+import pygame
+
+
+@dataclass
+class Item:
+    kind: str
+    key: Any
+    rect: pygame.Rect  # before scrolling
+    scrolls: bool
+
+
+class Column:
+    def __init__(self, area: pygame.Rect, padding: int):
+        self.area = area
+        self.padding = padding
+        self.items: List[Item] = []
+        self.cursor = area.y + padding
+        # content y where scrolling items start; None until begin_scroll
+        self.scroll_top: Optional[int] = None
+        self.scroll = 0
+        # item tops in order, for bisecting; items never overlap vertically
+        self._tops: List[int] = []
+
+    def add(self, kind: str, key: Any, height: int, gap: int = 0, indent: int = 0):
+        x = self.area.x + self.padding + indent
+        w = self.area.w - 2 * self.padding - indent
+        item = Item(kind, key, pygame.Rect(x, self.cursor, w, height), self.scrolling)
+        self.items.append(item)
+        self._tops.append(self.cursor)
+        self.cursor += height + gap
+        return item
+
+    def space(self, height: int):
+        self.cursor += height
+
+    @property
+    def scrolling(self) -> bool:
+        return self.scroll_top is not None
+
+    def begin_scroll(self):
+        self.scroll_top = self.cursor
+
+    def scroll_area(self) -> pygame.Rect:
+        top = self.scroll_top if self.scrolling else self.area.bottom
+        return pygame.Rect(self.area.x, top, self.area.w, self.area.bottom - top)
+
+    @property
+    def max_scroll(self) -> int:
+        if not self.scrolling:
+            return 0
+        return max(0, self.cursor + self.padding - self.area.bottom)
+
+    def scroll_by(self, dy: int):
+        self.scroll = min(max(self.scroll + dy, 0), self.max_scroll)
+
+    def screen_rect(self, item: Item) -> pygame.Rect:
+        return item.rect.move(0, -self.scroll) if item.scrolls else item.rect
+
+    def visible(self) -> Iterator[Tuple[Item, pygame.Rect]]:
+        """
+        (item, on-screen rect) for every item that can be seen.
+        """
+        view = self.scroll_area()
+        for item in self.items:
+            rect = self.screen_rect(item)
+            if not item.scrolls or rect.colliderect(view):
+                yield item, rect
+
+    def hit(self, x: int, y: int) -> Optional[Item]:
+        """
+        The item under the screen point (x, y), if any.
+        """
+        if not self.area.collidepoint(x, y):
+            return None
+        if self.scrolling and y >= self.scroll_top:
+            y += self.scroll
+        # stacked items: only the last one starting above y can contain it
+        i = bisect.bisect_right(self._tops, y) - 1
+        if i >= 0 and self.items[i].rect.collidepoint(x, y):
+            return self.items[i]
+        return None
@@ -1,18 +1,55 @@
+import time
+
+# startup phases as (name, end time); printed with --startup-report
+startup = [("start", time.perf_counter())]
+
 import pygame, sys
+from collections import Counter
 import config, world, resources
-from world import init_world, update_tile, place_terrain
+from world import init_world
+import layout
+import profiler
 import render
-from collections import defaultdict
+import savefile
+import scheduler
+from sim import SimulationDriver
+
+startup.append(("imports", time.perf_counter()))
 
-pygame.init()
+# only what the game uses; pygame.init() would also open the audio device
+# and scan for joysticks
+pygame.display.init()
+pygame.font.init()
 screen = pygame.display.set_mode((1000, 700), pygame.RESIZABLE)
 pygame.display.set_caption("Bananarchy")
+clock = pygame.time.Clock()
+font = render.load_font(config.FONT_NAME, config.FONT_SIZE)
+startup.append(("init", time.perf_counter()))
 
-tile_data = init_world(config.MAP_WIDTH, config.MAP_HEIGHT)
-clock, font = pygame.time.Clock(), pygame.font.SysFont(None, 24)
+if "--connect" in sys.argv:
+    # view a world run by remote.py instead of simulating one here
+    import remote
 
-TICK_EVENT = pygame.USEREVENT + 1
-pygame.time.set_timer(TICK_EVENT, 2000)
+    host, port = sys.argv[sys.argv.index("--connect") + 1].rsplit(":", 1)
+    sim = remote.RemoteDriver(host, int(port))
+    config.MAP_WIDTH, config.MAP_HEIGHT = sim.width, sim.height
+else:
+    saved = savefile.resume(config.SAVE_PATH)
+    if saved:
+        grid, ticks = saved
+        # the map keeps the size it was saved with
+        config.MAP_WIDTH, config.MAP_HEIGHT = grid.width, grid.height
+    else:
+        grid, ticks = init_world(config.MAP_WIDTH, config.MAP_HEIGHT), 0
+    autosave = savefile.Autosave(config.SAVE_PATH, grid, ticks)
+    sim = SimulationDriver(
+        grid, scheduler.EventTicker(), autosave=autosave, ticks=ticks
+    )
+# the loop sleeps while nothing changes; every published snapshot wakes it
+WAKE = pygame.event.custom_type()
+sim.on_publish = lambda: pygame.event.post(pygame.event.Event(WAKE))
+sim.start()
+startup.append(("world", time.perf_counter()))
 
 PAGE_TOOLS = 0
 PAGE_ERASE = 1
@@ -21,241 +58,448 @@ PAGE_STATS = 3
 current_page = PAGE_TOOLS
 info_cell = None
 expanded_resource = None
+rates_shown = False
+camera = render.Camera()
+dragging = False
+show_overlay = False
+recording = False
+# how a click on the map applies the tool: one tile, a dragged rectangle
+# or a flood fill of the matching region (A cycles)
+AREA_MODES = ["tile", "rect", "fill"]
+area_mode = "tile"
+drag_start = None
+
+
+def submit_area(cells):
+    if not cells:
+        return
+    if current_page == PAGE_ERASE:
+        sim.submit("erase_tiles", cells)
+    else:
+        kind, key = world.get_selected_tool()
+        name = "place_buildings" if kind == "building" else "place_terrains"
+        sim.submit(name, cells, key)
+
+
+# what the last drawn frame showed; a frame whose inputs all match is
+# skipped, and one where only the hover cell or the simulation state moved
+# updates just those parts of the screen
+last_view = None
+last_hover = (None, None)
+last_data = None
+# the last frame had nothing to draw, so the next one waits for a wake-up
+idle = False
+# longest idle sleep; publishes and input normally end it much sooner
+IDLE_WAIT_MS = 1000
+# hover is only picked again when the pointer or the view moves
+hover_key = None
+hover = (None, None)
+
+
+PAGE_NAMES = ["Tools", "Erase", "Info", "Stats"]
+SCROLL_LINES = 3  # sidebar lines per mouse wheel step
+
+# the sidebar's layout.Column, rebuilt by layout_sidebar when what it
+# shows changes; drawing and clicks both go through it
+sidebar = None
+sidebar_key = None
+# rows of the Stats page and what they were worked out from: the solved
+# rates, or the ledger until the first solve lands. The driver keeps
+# publishing the same rates until an edit, so they are rarely redone.
+stats_breakdown = []
+stats_starved = []
+stats_source = None
+
+
+def update_stats(tile_data):
+    global stats_breakdown, stats_starved, stats_source
+    rates = tile_data.rates
+    source = (rates or tile_data.ledger, expanded_resource)
+    if stats_source and source[0] is stats_source[0] and source[1] == stats_source[1]:
+        return
+    stats_source = source
+    stats_breakdown = (
+        source[0].breakdown(expanded_resource) if expanded_resource else []
+    )
+    stats_starved = []
+    if rates:
+        starved = Counter((p.name, p.limit) for p in rates.bottlenecks())
+        stats_starved = starved.most_common(5)
+
+
+def layout_sidebar(tile_data, usable_sw, sh):
+    global sidebar, sidebar_key
+    pad = config.PANEL_PADDING
+    line_h = font.get_height() + 2
+    info = None
+    if current_page == PAGE_INFO and info_cell:
+        bid = tile_data.building_id(*info_cell)
+        info = (info_cell, bid != 0, bool(world.ROLES[bid] & world.ROLE_UPGRADABLE))
+    rows = None
+    if current_page == PAGE_STATS:
+        update_stats(tile_data)
+        # compared by identity: the rows only change along with it
+        rows = stats_source[0]
+    key = (usable_sw, sh, line_h, current_page, info, expanded_resource, rows)
+    if key == sidebar_key:
+        return
+    # keep the scroll position while the page stays the same
+    scroll = sidebar.scroll if sidebar and sidebar_key[3] == current_page else 0
+    col = layout.Column(pygame.Rect(usable_sw, 0, config.PANEL_WIDTH, sh), pad)
+    for page in range(len(PAGE_NAMES)):
+        col.add("tab", page, font.get_height() + pad)
+    col.begin_scroll()
+    if current_page == PAGE_TOOLS:
+        for i in range(len(world.TOOLS)):
+            col.add("tool", i, config.ICON_SIZE + pad)
+    elif info:
+        for i in range(4 if info[1] else 3):
+            col.add("text", i, font.get_height(), 2)
+        if info[2]:
+            col.space(pad)
+            col.add("upgrade", info_cell, font.get_height() + pad // 2)
+    elif current_page == PAGE_STATS:
+        for res_key in resources.RESOURCES:
+            col.add("resource", res_key, font.get_height(), 2)
+            if res_key == expanded_resource:
+                for i in range(len(stats_breakdown)):
+                    col.add("source", i, font.get_height(), 2, indent=10)
+        if stats_starved:
+            col.space(font.get_height() // 2)
+            col.add("heading", None, font.get_height(), 2)
+            for i in range(len(stats_starved)):
+                col.add("bottleneck", i, 2 * line_h - 2, 2)
+    col.scroll_by(scroll)
+    sidebar, sidebar_key = col, key
+
+
+def select_tool(idx):
+    world.set_selected_tool(idx)
+    sim.note("select_tool", world._selected_tool)
+
 
 running = True
 while running:
+    if idle:
+        events = [pygame.event.wait(IDLE_WAIT_MS)] + pygame.event.get()
+    else:
+        events = pygame.event.get()
+    events = [ev for ev in events if ev.type not in (pygame.NOEVENT, WAKE)]
+    frame_t0 = profiler.start()
+    tile_data, changed = sim.latest()
     sw, sh = screen.get_size()
     usable_sw = sw - config.PANEL_WIDTH
-    tw, th, ox, oy = render.calculate_scaling(usable_sw, sh)
+    camera.update(usable_sw, sh)
+    keys = pygame.key.get_pressed()
+    pan_x = keys[pygame.K_LEFT] - keys[pygame.K_RIGHT]
+    pan_y = keys[pygame.K_UP] - keys[pygame.K_DOWN]
+    if pan_x or pan_y:
+        camera.pan(pan_x * config.PAN_SPEED, pan_y * config.PAN_SPEED)
+    tw, th, ox, oy = camera.view()
+
+    if rates_shown != (current_page == PAGE_STATS):
+        rates_shown = current_page == PAGE_STATS
+        sim.show_rates(rates_shown)
 
     mx, my = pygame.mouse.get_pos()
-    if mx < usable_sw:
-        hover = render.find_clicked_tile(mx, my, tw, th, ox, oy)
-    else:
-        hover = (None, None)
+    view = (screen.get_size(), tw, th, ox, oy)
+    if (mx, my, view, tile_data.width, tile_data.height) != hover_key:
+        hover_key = (mx, my, view, tile_data.width, tile_data.height)
+        if mx < usable_sw:
+            with profiler.scope("find_clicked_tile"):
+                hover = render.find_clicked_tile(
+                    mx, my, tw, th, ox, oy, tile_data.width, tile_data.height
+                )
+        else:
+            hover = (None, None)
+    redraw_all = (
+        view != last_view
+        or bool(changed)
+        or show_overlay
+        or (drag_start is not None and hover != last_hover)
+    )
 
-    for ev in pygame.event.get():
+    if events:
+        # clicks and the wheel go through the sidebar's layout
+        layout_sidebar(tile_data, usable_sw, sh)
+    events_t0 = profiler.start()
+    for ev in events:
+        if ev.type != pygame.MOUSEMOTION or dragging:
+            # clicks, keys and window events can change anything on screen
+            redraw_all = True
         if ev.type == pygame.QUIT:
             running = False
         elif ev.type == pygame.VIDEORESIZE:
             screen = pygame.display.set_mode((ev.w, ev.h), pygame.RESIZABLE)
         elif ev.type == pygame.MOUSEBUTTONDOWN and ev.button == 1:
             if mx > usable_sw:
-                btn_y = config.PANEL_PADDING
-                btn_h = font.get_height() + config.PANEL_PADDING
-                btn_x = usable_sw + config.PANEL_PADDING
-
-                if btn_y <= my < btn_y + btn_h:
-                    current_page = PAGE_TOOLS
-                elif btn_y + btn_h <= my < btn_y + 2 * btn_h:
-                    current_page = PAGE_ERASE
-                elif btn_y + 2 * btn_h <= my < btn_y + 3 * btn_h:
-                    current_page = PAGE_INFO
-                elif btn_y + 3 * btn_h <= my < btn_y + 4 * btn_h:
-                    current_page = PAGE_STATS
-                elif current_page == PAGE_INFO and info_cell:
-                    line_count = 4
-                    start_y = btn_y + 4 * btn_h
-                    text_y = start_y + line_count * (font.get_height() + 2)
-                    up_x = btn_x
-                    up_y = text_y + config.PANEL_PADDING
-                    up_w = config.PANEL_WIDTH - 2 * config.PANEL_PADDING
-                    up_h = font.get_height() + config.PANEL_PADDING // 2
-                    upgr_btn = pygame.Rect(up_x, up_y, up_w, up_h)
-                    if upgr_btn.collidepoint(mx, my):
-                        gx, gy = info_cell
-                        world.upgrade_tile(tile_data, gx, gy)
-                elif current_page == PAGE_TOOLS:
-                    start_y = btn_y + 4 * btn_h
-                    idx = (my - start_y) // (config.ICON_SIZE + config.PANEL_PADDING)
-                    if 0 <= idx < len(world.TOOLS):
-                        world.set_selected_tool(idx)
-                elif current_page == PAGE_STATS:
-                    # Detect which resource was clicked
-                    y = btn_y + 4 * btn_h
-                    for res_key in resources.RESOURCES:
-                        rect = pygame.Rect(
-                            btn_x, y, config.PANEL_WIDTH, font.get_height()
-                        )
-                        if rect.collidepoint(mx, my):
-                            expanded_resource = (
-                                res_key if expanded_resource != res_key else None
-                            )
-                        y += font.get_height() + 2
-                        if expanded_resource == res_key:
-                            for _ in range(3):  # space for a few lines of building info
-                                y += font.get_height() + 2
+                item = sidebar.hit(mx, my)
+                if item is None:
+                    pass
+                elif item.kind == "tab":
+                    current_page = item.key
+                elif item.kind == "tool":
+                    select_tool(item.key)
+                elif item.kind == "upgrade":
+                    sim.submit("upgrade_tile", *item.key)
+                elif item.kind == "resource":
+                    expanded_resource = (
+                        item.key if expanded_resource != item.key else None
+                    )
             else:
-                gx, gy = render.find_clicked_tile(mx, my, tw, th, ox, oy)
+                gx, gy = render.find_clicked_tile(
+                    mx, my, tw, th, ox, oy, tile_data.width, tile_data.height
+                )
                 if gx is not None:
-                    if current_page == PAGE_ERASE:
-                        tile_data[gy][gx]["building"] = None
-                    elif current_page == PAGE_INFO:
+                    if current_page == PAGE_INFO:
                         info_cell = (gx, gy)
+                    elif area_mode == "rect":
+                        drag_start = (gx, gy)
+                    elif area_mode == "fill":
+                        submit_area(
+                            world.flood_cells(tile_data, gx, gy, config.MAX_FILL_CELLS)
+                        )
+                    elif current_page == PAGE_ERASE:
+                        sim.submit("erase_tile", gx, gy)
                     else:
                         kind, key = world.get_selected_tool()
-                        cell = tile_data[gy][gx]
                         if kind == "building":
-                            bld = world.BUILDINGS[key]
-                            if cell["terrain"] in bld.allowed_terrains:
-                                update_tile(tile_data, gx, gy, bld)
+                            sim.submit("place_building", gx, gy, key)
                         else:
-                            place_terrain(tile_data, gx, gy, key)
+                            sim.submit("place_terrain", gx, gy, key)
+            # a new tab, expanded resource or inspected tile moves the
+            # items the next click in this batch is tested against
+            layout_sidebar(tile_data, usable_sw, sh)
+        elif ev.type == pygame.MOUSEBUTTONUP and ev.button == 1 and drag_start:
+            if hover[0] is not None:
+                submit_area(world.rect_cells(*drag_start, *hover))
+            drag_start = None
+        elif ev.type == pygame.MOUSEBUTTONDOWN and ev.button == 3:
+            dragging = mx < usable_sw
+        elif ev.type == pygame.MOUSEBUTTONUP and ev.button == 3:
+            dragging = False
+        elif ev.type == pygame.MOUSEMOTION and dragging:
+            camera.pan(*ev.rel)
+        elif ev.type == pygame.MOUSEWHEEL and mx < usable_sw:
+            camera.zoom_at(config.ZOOM_STEP**ev.y, mx, my)
+        elif ev.type == pygame.MOUSEWHEEL:
+            sidebar.scroll_by(-ev.y * SCROLL_LINES * (font.get_height() + 2))
         elif ev.type == pygame.KEYDOWN:
             if ev.key == pygame.K_q:
-                world.set_selected_tool(world._selected_tool - 1)
+                select_tool(world._selected_tool - 1)
             elif ev.key == pygame.K_e:
-                world.set_selected_tool(world._selected_tool + 1)
-        elif ev.type == TICK_EVENT:
-            world.simulate_tick(tile_data)
+                select_tool(world._selected_tool + 1)
+            elif ev.key == pygame.K_a:
+                area_mode = AREA_MODES[(AREA_MODES.index(area_mode) + 1) % 3]
+                drag_start = None
+            elif ev.key == pygame.K_HOME:
+                camera.fit(usable_sw, sh)
+            elif pygame.K_1 <= ev.key < pygame.K_1 + len(config.SIM_SPEEDS):
+                sim.set_speed(config.SIM_SPEEDS[ev.key - pygame.K_1])
+            elif ev.key == pygame.K_F3:
+                show_overlay = not show_overlay
+                profiler.set_enabled(show_overlay)
+            elif ev.key == pygame.K_F4:
+                profiler.export(config.TRACE_PATH)
+            elif ev.key == pygame.K_F5:
+                recording = not recording
+                sim.record(config.RECORD_PATH if recording else None)
+    profiler.stop("events", events_t0)
+
+    dirty_rects = []
+    if not redraw_all:
+        if hover != last_hover:
+            for cell in (last_hover, hover):
+                if cell[0] is not None:
+                    dirty_rects.append(render.tile_rect(*cell, tw, th, ox, oy))
+        if tile_data is not last_data:
+            # a tick moves the stock counts in the corner and the sidebar
+            hud_h = (
+                18
+                + font.get_height()
+                + len(resources.RESOURCES) * (font.get_height() + 2)
+            )
+            dirty_rects.append(pygame.Rect(0, 0, usable_sw, hud_h))
+            dirty_rects.append(pygame.Rect(usable_sw, 0, config.PANEL_WIDTH, sh))
+        idle = not dirty_rects
+        if idle:
+            continue
+        screen.set_clip(dirty_rects[0].unionall(dirty_rects[1:]))
+    idle = False
+    last_view, last_hover, last_data = view, hover, tile_data
 
     screen.fill(config.COLORS["background"])
-    render.draw_grid(screen, tile_data, tw, th, ox, oy)
+    with profiler.scope("draw_grid"):
+        render.draw_grid(screen, tile_data, tw, th, ox, oy, changed)
     if hover[0] is not None:
         render.draw_highlight(screen, hover[0], hover[1], tw, th, ox, oy)
+        if drag_start:
+            x0, y0 = drag_start
+            cells = world.rect_cells(x0, y0, *hover)
+            if len(cells) > 400:
+                # outline only; highlighting every tile gets slow
+                cells = [
+                    p for p in cells if p[0] in (x0, hover[0]) or p[1] in (y0, hover[1])
+                ]
+            for x, y in cells:
+                render.draw_highlight(screen, x, y, tw, th, ox, oy)
 
+    sidebar_t0 = profiler.start()
     pygame.draw.rect(
         screen, config.COLORS["panel_bg"], (usable_sw, 0, config.PANEL_WIDTH, sh)
     )
 
-    btn_x = usable_sw + config.PANEL_PADDING
-    btn_y = config.PANEL_PADDING
-    btn_h = font.get_height() + config.PANEL_PADDING
-    screen.blit(font.render("Tools", True, (255, 255, 255)), (btn_x, btn_y))
-    screen.blit(font.render("Erase", True, (255, 255, 255)), (btn_x, btn_y + btn_h))
-    screen.blit(font.render("Info", True, (255, 255, 255)), (btn_x, btn_y + 2 * btn_h))
-    screen.blit(font.render("Stats", True, (255, 255, 255)), (btn_x, btn_y + 3 * btn_h))
-
-    if current_page == PAGE_TOOLS:
-        highlight_y = btn_y
-    elif current_page == PAGE_ERASE:
-        highlight_y = btn_y + btn_h
-    elif current_page == PAGE_INFO:
-        highlight_y = btn_y + 2 * btn_h
-    else:
-        highlight_y = btn_y + 3 * btn_h
-    w = config.PANEL_WIDTH - 2 * config.PANEL_PADDING
-    pygame.draw.rect(
-        screen, config.COLORS["highlight"], (btn_x - 2, highlight_y - 2, w, btn_h), 2
-    )
-
-    if current_page == PAGE_TOOLS:
-        start_y = btn_y + 4 * btn_h
-        for i, (kind, key) in enumerate(world.TOOLS):
-            x0 = usable_sw + config.PANEL_PADDING
-            y0 = start_y + i * (config.ICON_SIZE + config.PANEL_PADDING)
-            if kind == "terrain":
-                col = world.TERRAINS[key].color
-                pts = [
-                    (x0 + config.ICON_SIZE // 2, y0),
-                    (x0 + config.ICON_SIZE, y0 + config.ICON_SIZE // 2),
-                    (x0 + config.ICON_SIZE // 2, y0 + config.ICON_SIZE),
-                    (x0, y0 + config.ICON_SIZE // 2),
-                ]
-                pygame.draw.polygon(screen, col, pts)
-            else:
-                b = world.BUILDINGS[key]
-                cx = x0 + config.ICON_SIZE // 2
-                cy = y0 + config.ICON_SIZE // 2
-                sz = config.ICON_SIZE // 2 - 4
-                pygame.draw.rect(screen, b.color, (cx - sz, cy - sz, 2 * sz, 2 * sz))
-            if i == world._selected_tool:
-                pygame.draw.rect(
-                    screen,
-                    config.COLORS["highlight"],
-                    (x0 - 2, y0 - 2, config.ICON_SIZE + 4, config.ICON_SIZE + 4),
-                    2,
-                )
-
+    layout_sidebar(tile_data, usable_sw, sh)
+    clip = screen.get_clip()
+    scroll_clip = clip.clip(sidebar.scroll_area())
+    if current_page == PAGE_STATS:
+        totals = tile_data.ledger.totals()
+        # solved steady-state rates; nominal ones until the first solve lands
+        rates = tile_data.rates
+        actual = rates.totals() if rates else {}
     if current_page == PAGE_INFO and info_cell:
         gx, gy = info_cell
-        cell = tile_data[gy][gx]
-        terrain = cell["terrain"]
-        bld = cell["building"]
+        bld = tile_data.building(gx, gy)
         info_lines = [
             f"Tile ({gx},{gy})",
-            f"Terrain: {terrain}",
+            f"Terrain: {tile_data.terrain(gx, gy)}",
         ]
         if bld:
             info_lines.append(f"Building: {bld.name}")
-            info_lines.append(f"Level: {cell['level']}")
+            info_lines.append(f"Level: {tile_data.level(gx, gy)}")
         else:
             info_lines.append("Building: None")
-        text_y = btn_y + 4 * btn_h
-        for line in info_lines:
-            screen.blit(font.render(line, True, (255, 255, 255)), (btn_x, text_y))
-            text_y += font.get_height() + 2
-        if bld and bld.name not in ("Chimp Chest", "Conveyer Belt"):
-            up_x = btn_x
-            up_y = text_y + config.PANEL_PADDING
-            up_w = config.PANEL_WIDTH - 2 * config.PANEL_PADDING
-            up_h = font.get_height() + config.PANEL_PADDING // 2
-            pygame.draw.rect(screen, config.COLORS["side1"], (up_x, up_y, up_w, up_h))
+
+    for item, rect in sidebar.visible():
+        screen.set_clip(scroll_clip if item.scrolls else clip)
+        if item.kind == "tab":
             screen.blit(
-                font.render("Upgrade", True, (255, 255, 255)),
-                (up_x + config.PANEL_PADDING // 2, up_y + config.PANEL_PADDING // 2),
+                render.render_text(font, PAGE_NAMES[item.key], (255, 255, 255)),
+                rect.topleft,
             )
-
-    elif current_page == PAGE_STATS:
-        y = btn_y + 4 * btn_h
-        totals = defaultdict(int)
-        sources = defaultdict(list)
-        for row in tile_data:
-            for cell in row:
-                b = cell["building"]
-                lvl = cell["level"]
-                if not b:
-                    continue
-                for res, amt in b.outputs.items():
-                    net = amt * (2 ** (lvl - 1))
-                    totals[res] += net
-                    sources[res].append((b.name, lvl, net, "green"))
-                for res, amt in b.inputs.items():
-                    cost = amt * (2 ** (lvl - 1))
-                    totals[res] -= cost
-                    sources[res].append((b.name, lvl, -cost, "red"))
-
-        for res_key in resources.RESOURCES:
+            if item.key == current_page:
+                pygame.draw.rect(
+                    screen, config.COLORS["highlight"], rect.move(-2, -2), 2
+                )
+        elif item.kind == "tool":
+            screen.blit(render.tool_icon(item.key), rect.topleft)
+            if item.key == world._selected_tool:
+                pygame.draw.rect(
+                    screen,
+                    config.COLORS["highlight"],
+                    (
+                        rect.x - 2,
+                        rect.y - 2,
+                        config.ICON_SIZE + 4,
+                        config.ICON_SIZE + 4,
+                    ),
+                    2,
+                )
+        elif item.kind == "text":
+            screen.blit(
+                render.render_text(font, info_lines[item.key], (255, 255, 255)),
+                rect.topleft,
+            )
+        elif item.kind == "upgrade":
+            pygame.draw.rect(screen, config.COLORS["side1"], rect)
+            screen.blit(
+                render.render_text(font, "Upgrade", (255, 255, 255)),
+                (
+                    rect.x + config.PANEL_PADDING // 2,
+                    rect.y + config.PANEL_PADDING // 2,
+                ),
+            )
+        elif item.kind == "resource":
+            res_key = item.key
             net = totals.get(res_key, 0)
+            label = f"{resources.RESOURCES[res_key]['name']}: {net:+}"
+            if rates:
+                net = round(actual[res_key], 2)
+                label = f"{resources.RESOURCES[res_key]['name']}: {net:+g}"
+                if net != totals.get(res_key, 0):
+                    label += f" (max {totals.get(res_key, 0):+})"
             color = (
                 (0, 255, 0)
                 if net > 0
                 else (255, 100, 100) if net < 0 else (255, 255, 255)
             )
+            screen.blit(render.render_text(font, label, color), rect.topleft)
+        elif item.kind == "source":
+            bname, lvl, count, amt = stats_breakdown[item.key]
+            tone_col = (0, 255, 0) if amt > 0 else (255, 100, 100)
             screen.blit(
-                font.render(
-                    f"{resources.RESOURCES[res_key]['name']}: {net:+}", True, color
+                render.render_text(
+                    font, f"  {bname} Lv{lvl} x{count}: {round(amt, 2):+g}", tone_col
                 ),
-                (btn_x, y),
+                rect.topleft,
             )
-            y += font.get_height() + 2
-            if res_key == expanded_resource:
-                for bname, lvl, amt, tone in sources.get(res_key, []):
-                    tone_col = (0, 255, 0) if tone == "green" else (255, 100, 100)
-                    screen.blit(
-                        font.render(f"  {bname} Lv{lvl}: {amt:+}", True, tone_col),
-                        (btn_x + 10, y),
-                    )
-                    y += font.get_height() + 2
-
-    # Top-left resource count
-    totals = defaultdict(int)
-    for row in tile_data:
-        for cell in row:
-            b = cell["building"]
-            if b and b.name == "Chimp Chest":
-                for res, qty in cell["inventory"].items():
-                    totals[res] += qty
+        elif item.kind == "heading":
+            screen.blit(
+                render.render_text(font, "Bottlenecks", (255, 255, 255)), rect.topleft
+            )
+        elif item.kind == "bottleneck":
+            (bname, limit), count = stats_starved[item.key]
+            if limit in resources.RESOURCES:
+                limit = "short of " + resources.RESOURCES[limit]["name"]
+            y = rect.y
+            for line in (f"{bname} x{count}", f"  {limit}"):
+                screen.blit(
+                    render.render_text(font, line, (255, 200, 100)), (rect.x, y)
+                )
+                y += font.get_height() + 2
+    screen.set_clip(clip)
+
+    if sidebar.max_scroll:
+        # scroll bar along the panel's right edge
+        view = sidebar.scroll_area()
+        content = sidebar.cursor + config.PANEL_PADDING - view.y
+        bar_h = max(view.h * view.h // content, 8)
+        bar_y = view.y + (view.h - bar_h) * sidebar.scroll // sidebar.max_scroll
+        pygame.draw.rect(
+            screen,
+            config.COLORS["side2"],
+            (usable_sw + config.PANEL_WIDTH - 4, bar_y, 3, bar_h),
+        )
+
+    profiler.stop("sidebar", sidebar_t0)
+
+    # Top-left tick counter and resource count
+    speed = f"{sim.speed}x" if sim.speed else "max"
+    status = f"Tick {tile_data.tick} ({speed})"
+    if area_mode != "tile":
+        status += f" | {area_mode}"
+    if recording:
+        status += " | REC"
+    screen.blit(render.render_text(font, status, (255, 255, 255)), (10, 10))
+    totals = tile_data.ledger.stock_totals()
     y_off = 10 + font.get_height() + 8
     for res_key, info in resources.RESOURCES.items():
         qty = totals.get(res_key, 0)
         screen.blit(
-            font.render(f"{info['name']}: {qty}", True, (255, 255, 255)), (10, y_off)
+            render.render_text(font, f"{info['name']}: {qty}", (255, 255, 255)),
+            (10, y_off),
         )
         y_off += font.get_height() + 2
 
-    pygame.display.flip()
+    if show_overlay:
+        render.draw_profile_overlay(screen, font, usable_sw - 340, 10)
+
+    screen.set_clip(None)
+    with profiler.scope("flip"):
+        if redraw_all:
+            pygame.display.flip()
+        else:
+            pygame.display.update(dirty_rects)
     clock.tick(60)
+    profiler.stop("frame", frame_t0)
+    if startup:
+        startup.append(("first frame", time.perf_counter()))
+        if "--startup-report" in sys.argv:
+            for (_, t0), (name, t1) in zip(startup, startup[1:]):
+                print(f"{name:<12} {(t1 - t0) * 1000:8.1f} ms")
+            print(f"{'total':<12} {(t1 - startup[0][1]) * 1000:8.1f} ms")
+        startup = None
 
+sim.stop()
 pygame.quit()
 sys.exit()
@@ -0,0 +1,133 @@
+"""
+Seeded synthetic map generators for headless runs and benchmarks.
+
+Every generator builds its world through init_world, place_terrain and
+update_tile, so the derived indexes are exercised the same way as when a
+player builds by hand.
+"""
+
+import random
+from typing import Callable, Dict
+
+import world
+from world import init_world, place_terrain, update_tile
+
+CHEST = world.BUILDINGS[1]
+BELT = world.BUILDINGS[2]
+PRODUCERS = [b for b in world.BUILDINGS_LIST if b.outputs]
+
+
+def build(world_grid, x: int, y: int, b: world.Building):
+    """
+    Place b at (x, y), painting the first allowed terrain if needed.
+    """
+    if not world.allows(b.id, world_grid.terrain_code(x, y)):
+        place_terrain(world_grid, x, y, b.allowed_terrains[0])
+    update_tile(world_grid, x, y, b)
+
+
+def random_fill(width: int, height: int, seed: int, density: float):
+    rng = random.Random(seed)
+    g = init_world(width, height)
+    for y in range(height):
+        for x in range(width):
+            if rng.random() >= density:
+                continue
+            r = rng.random()
+            if r < 0.45:
+                b = BELT
+            elif r < 0.55:
+                b = CHEST
+            else:
+                b = rng.choice(PRODUCERS)
+            build(g, x, y, b)
+    return g
+
+
+def sparse(width: int, height: int, seed: int = 0):
+    return random_fill(width, height, seed, 0.05)
+
+
+def dense(width: int, height: int, seed: int = 0):
+    return random_fill(width, height, seed, 0.7)
+
+
+def belt_snake(width: int, height: int, seed: int = 0):
+    """
+    One long boustrophedon belt with producers along it and a chest at the
+    head, so every producer shares a single huge network.
+    """
+    rng = random.Random(seed)
+    g = init_world(width, height)
+    for y in range(0, height, 2):
+        for x in range(width):
+            build(g, x, y, BELT)
+        # link to the next run at alternating ends
+        if y + 1 < height:
+            link = width - 1 if (y // 2) % 2 == 0 else 0
+            build(g, link, y + 1, BELT)
+            for x in range(width):
+                if x != link and rng.random() < 0.5:
+                    build(g, x, y + 1, rng.choice(PRODUCERS))
+    build(g, 0, 0, CHEST)
+    return g
+
+
+def many_chests(width: int, height: int, seed: int = 0):
+    """
+    Small independent cells: a chest with a couple of producers on it.
+    """
+    rng = random.Random(seed)
+    g = init_world(width, height)
+    for y in range(1, height - 1, 3):
+        for x in range(1, width - 1, 3):
+            build(g, x, y, CHEST)
+            for dx, dy in ((1, 0), (0, 1), (-1, 0), (0, -1)):
+                if rng.random() < 0.5:
+                    build(g, x + dx, y + dy, rng.choice(PRODUCERS))
+    return g
+
+
+# Raw producers first so each segment's chest fills up before the
+# consumers further down the line draw from it.
+CHAIN = [
+    world.BUILDINGS[5],  # Clay Pit
+    world.BUILDINGS[4],  # Bamboo Thicket
+    world.BUILDINGS[3],  # Banana Grove
+    world.BUILDINGS[5],
+    world.BUILDINGS[8],  # Mud Kiln
+    world.BUILDINGS[6],  # Splinter Shack
+    world.BUILDINGS[10],  # Brick Smusher
+    world.BUILDINGS[7],  # Sticky Press
+    world.BUILDINGS[9],  # Rope Twister
+]
+
+
+def production_chains(width: int, height: int, seed: int = 0, segment: int = 16):
+    """
+    Rows of belt spines, each split into segments with its own chest, fed
+    by producers above and below: Clay Pit -> Mud Kiln, Bamboo Thicket ->
+    Splinter Shack -> Brick Smusher and so on.
+    """
+    rng = random.Random(seed)
+    g = init_world(width, height)
+    for y in range(1, height - 1, 4):
+        for x in range(width):
+            start = x % segment == 0
+            if x % segment == segment - 1:
+                continue  # gap between segments
+            build(g, x, y, CHEST if start else BELT)
+            if start:
+                continue
+            for py in (y - 1, y + 1):
+                build(g, x, py, CHAIN[(x + py + rng.randrange(2)) % len(CHAIN)])
+    return g
+
+
+GENERATORS: Dict[str, Callable] = {
+    "sparse": sparse,
+    "dense": dense,
+    "snake": belt_snake,
+    "chests": many_chests,
+    "chains": production_chains,
+}
@@ -0,0 +1,283 @@
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+CHEST_ID = 1
+BELT_ID = 2
+
+NEIGHBORS = [(0, 1), (1, 0), (-1, 0), (0, -1)]
+
+Pos = Tuple[int, int]
+
+
+class NetworkIndex:
+    """
+    Persistent conveyor connectivity for a world grid.
+
+    Belts are grouped into connected components. Each producer keeps a
+    cached list of the Chimp Chests it can reach, in the same order the
+    old per-tick BFS discovered them, so "first chest that can afford the
+    inputs" stays identical. Whenever a component's belts or the chests
+    around it change, the producers next to it are marked dirty, so a
+    cached list stays valid until then without being checked per query.
+    """
+
+    def __init__(self, world_grid):
+        self.grid = world_grid
+        self.labels: Dict[Pos, int] = {}
+        self.comp_cells: Dict[int, Set[Pos]] = {}
+        self.comp_producers: Dict[int, Set[Pos]] = {}
+        self.comp_chests: Dict[int, Set[Pos]] = {}
+        self.reach: Dict[Pos, List[Pos]] = {}
+        self.dirty: Set[Pos] = set()
+        # cells changed during a Grid.batch(), handled together on release
+        self.pending: Optional[Set[Pos]] = None
+        self._next_id = 0
+        self.stale = True
+        self.rebuild()
+
+    # grid access
+    def _bid(self, x: int, y: int) -> int:
+        return self.grid.building_id(x, y)
+
+    def _is_producer(self, x: int, y: int) -> bool:
+        return self.grid.is_producer(x, y)
+
+    def _neighbors(self, x: int, y: int):
+        W, H = self.grid.width, self.grid.height
+        for dx, dy in NEIGHBORS:
+            nx, ny = x + dx, y + dy
+            if 0 <= nx < W and 0 <= ny < H:
+                yield nx, ny
+
+    def _new_id(self) -> int:
+        self._next_id += 1
+        return self._next_id
+
+    def _adjacent_comps(self, x: int, y: int) -> Set[int]:
+        return {self.labels[p] for p in self._neighbors(x, y) if p in self.labels}
+
+    def _touch(self, comp: int):
+        self.dirty |= self.comp_producers[comp]
+
+    # component maintenance
+    def rebuild(self):
+        """
+        Forget everything; the components are flooded again on the next
+        query, so freshly loaded worlds don't pay for it up front.
+        """
+        self.stale = True
+
+    def _build(self):
+        self.stale = False
+        self.labels.clear()
+        self.comp_cells.clear()
+        self.comp_producers.clear()
+        self.comp_chests.clear()
+        self.reach.clear()
+        self.dirty.clear()
+        for x, y, bid, _ in self.grid.occupied():
+            if bid == BELT_ID and (x, y) not in self.labels:
+                self._flood(x, y)
+
+    def _flood(self, x: int, y: int):
+        comp = self._new_id()
+        cells = {(x, y)}
+        producers = set()
+        chests = set()
+        self.labels[(x, y)] = comp
+        queue = deque([(x, y)])
+        while queue:
+            cx, cy = queue.popleft()
+            for nx, ny in self._neighbors(cx, cy):
+                if (nx, ny) in self.labels:
+                    continue
+                bid = self._bid(nx, ny)
+                if bid == BELT_ID:
+                    self.labels[(nx, ny)] = comp
+                    cells.add((nx, ny))
+                    queue.append((nx, ny))
+                elif bid == CHEST_ID:
+                    chests.add((nx, ny))
+                elif self._is_producer(nx, ny):
+                    producers.add((nx, ny))
+        self.comp_cells[comp] = cells
+        self.comp_producers[comp] = producers
+        self.comp_chests[comp] = chests
+        self._touch(comp)
+
+    def _drop(self, comp: int) -> Set[Pos]:
+        cells = self.comp_cells.pop(comp)
+        del self.comp_producers[comp]
+        del self.comp_chests[comp]
+        for p in cells:
+            del self.labels[p]
+        return cells
+
+    def hold(self):
+        """
+        Collect invalidations instead of handling them one by one.
+        """
+        if self.pending is None:
+            self.pending = set()
+
+    def release(self):
+        cells, self.pending = self.pending, None
+        if cells and len(cells) == 1:
+            self.invalidate(*cells.pop())
+        elif cells:
+            self.invalidate_many(cells)
+
+    def invalidate_many(self, cells: Iterable[Pos]):
+        """
+        invalidate() for many cells at once: every component that touches
+        one of them is dropped and flooded again a single time, instead of
+        once per removed belt.
+        """
+        if self.stale:
+            return
+        cells = set(cells)
+        seeds = set()
+        for comp in {c for p in cells for c in self._adjacent_comps(*p)} | {
+            self.labels[p] for p in cells if p in self.labels
+        }:
+            self.dirty |= self.comp_producers[comp]
+            seeds |= self._drop(comp)
+        seeds |= cells
+        for p in seeds:
+            if p not in self.labels and self._bid(*p) == BELT_ID:
+                self._flood(*p)
+        for x, y in cells:
+            self._forget(x, y)
+
+    def invalidate(self, x: int, y: int):
+        """
+        Call after the building at (x, y) changed.
+        """
+        if self.stale:
+            return
+        if self.pending is not None:
+            self.pending.add((x, y))
+            return
+        was_belt = (x, y) in self.labels
+        is_belt = self._bid(x, y) == BELT_ID
+        adjacent = self._adjacent_comps(x, y)
+
+        if was_belt and not is_belt:
+            # removing a belt may split its component: re-flood what's left
+            for px, py in self._drop(self.labels[(x, y)]) - {(x, y)}:
+                if (px, py) not in self.labels:
+                    self._flood(px, py)
+        elif is_belt and not was_belt:
+            # adding a belt merges its neighbours into the largest one
+            for comp in adjacent:
+                self.comp_producers[comp].discard((x, y))
+                self.comp_chests[comp].discard((x, y))
+            if adjacent:
+                target = max(adjacent, key=lambda c: len(self.comp_cells[c]))
+                for comp in adjacent - {target}:
+                    self.comp_producers[target] |= self.comp_producers[comp]
+                    self.comp_chests[target] |= self.comp_chests[comp]
+                    for p in self._drop(comp):
+                        self.labels[p] = target
+                        self.comp_cells[target].add(p)
+                self.labels[(x, y)] = target
+                self.comp_cells[target].add((x, y))
+                self._touch(target)
+                for p in self._neighbors(x, y):
+                    if self._bid(*p) == CHEST_ID:
+                        self.comp_chests[target].add(p)
+                    elif self._is_producer(*p):
+                        self.comp_producers[target].add(p)
+            else:
+                self._flood(x, y)
+        elif not is_belt:
+            # a chest or producer changed next to these components
+            producer = self._is_producer(x, y)
+            chest = self._bid(x, y) == CHEST_ID
+            for comp in adjacent:
+                self._touch(comp)
+                if producer:
+                    self.comp_producers[comp].add((x, y))
+                else:
+                    self.comp_producers[comp].discard((x, y))
+                if chest:
+                    self.comp_chests[comp].add((x, y))
+                else:
+                    self.comp_chests[comp].discard((x, y))
+
+        self._forget(x, y)
+
+    def _forget(self, x: int, y: int):
+        # the reach of (x, y) and its neighbours may have changed
+        for p in [(x, y)] + list(self._neighbors(x, y)):
+            if self._is_producer(*p):
+                self.dirty.add(p)
+            else:
+                self.reach.pop(p, None)
+                self.dirty.discard(p)
+
+    # queries
+    def producers_near(self, cells: Iterable[Pos]) -> Set[Pos]:
+        """
+        Producers whose reachable chests may have changed since `cells`
+        did: producers on or next to those cells, plus every producer next
+        to a component that now holds or borders one. Call once the edits
+        have been invalidated; a split component's pieces all border the
+        removed belt, so they are found too.
+        """
+        if self.stale:
+            self._build()
+        found = set()
+        for x, y in cells:
+            for p in [(x, y)] + list(self._neighbors(x, y)):
+                if self._is_producer(*p):
+                    found.add(p)
+                if p in self.labels:
+                    found |= self.comp_producers[self.labels[p]]
+        return found
+
+    def reachable_chests(self, x: int, y: int) -> List[Pos]:
+        if self.stale:
+            self._build()
+        cached = self.reach.get((x, y))
+        if cached is None or (x, y) in self.dirty:
+            cached = self.reach[(x, y)] = self._order(x, y)
+            self.dirty.discard((x, y))
+        return cached
+
+    def _order(self, x: int, y: int) -> List[Pos]:
+        # The reachable set comes straight from the components; the BFS is
+        # only needed to order it, and stops once every chest is found.
+        targets = set()
+        for p in self._neighbors(x, y):
+            if p in self.labels:
+                targets |= self.comp_chests[self.labels[p]]
+            elif self._bid(*p) == CHEST_ID:
+                targets.add(p)
+        if len(targets) <= 1:
+            return list(targets)
+        return self._search(x, y, len(targets))
+
+    def _search(self, x: int, y: int, limit: int = -1) -> List[Pos]:
+        # BFS from the producer across belts; chests are recorded in
+        # first-discovery order, which is the order the tick tries them.
+        visited = {(x, y)}
+        seen_chests = set()
+        chests = []
+        queue = deque([(x, y)])
+        while queue:
+            cx, cy = queue.popleft()
+            for nx, ny in self._neighbors(cx, cy):
+                if (nx, ny) in visited:
+                    continue
+                bid = self._bid(nx, ny)
+                if bid == CHEST_ID:
+                    if (nx, ny) not in seen_chests:
+                        seen_chests.add((nx, ny))
+                        chests.append((nx, ny))
+                        if len(chests) == limit:
+                            return chests
+                elif bid == BELT_ID:
+                    visited.add((nx, ny))
+                    queue.append((nx, ny))
+        return chests
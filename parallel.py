@@ -0,0 +1,174 @@
+"""
+Tick evaluation sharded across processes by independent networks.
+
+Producers only ever touch the chests they can reach. Linking every
+producer to those chests splits the world into shards that share no
+chest. Running each shard's producers in their row-major order gives the
+same result as world.simulate_tick, no matter how the shards are spread
+over processes.
+
+While workers are in use the grid's chest stock lives in a shared-memory
+buffer: the grid is lent a view of it, workers update it in place and
+report their ledger deltas, and nothing is copied per tick. The grid gets
+an array of its own back when the shard plan changes.
+"""
+
+import multiprocessing as mp
+import os
+from array import array
+from multiprocessing import shared_memory
+from typing import List, Tuple
+
+import world
+
+# Below this many producers the pipe round-trips cost more than they save
+MIN_PARALLEL_PRODUCERS = 2000
+
+Producer = Tuple[int, int, List[int]]  # building id, level, chest offsets
+
+
+def build_shards(world_grid) -> List[List[Producer]]:
+    """
+    Group producers into shards that share no chest, each in tick order.
+    """
+    prods = [
+        (bid, lvl, world.used_chests(bid, offs))
+        for _, _, bid, lvl, offs in world.producer_links(world_grid)
+    ]
+    return world.split_shards(prods, lambda prod: prod[2])
+
+
+def run_producers(prods: List[Producer], stock, totals):
+    for bid, lvl, offs in prods:
+        world.produce(bid, lvl, offs, stock, totals)
+
+
+def _worker(conn):
+    shm = None
+    prods: List[Producer] = []
+    while True:
+        msg = conn.recv()
+        if msg[0] == "plan":
+            if shm is not None:
+                shm.close()
+            _, name, prods = msg
+            shm = shared_memory.SharedMemory(name=name)
+        elif msg[0] == "tick":
+            stock = shm.buf.cast("q")
+            totals = [0] * world.NUM_RESOURCES
+            run_producers(prods, stock, totals)
+            stock.release()
+            conn.send(totals)
+        else:
+            break
+    if shm is not None:
+        shm.close()
+
+
+class ParallelTicker:
+    """
+    Callable tick engine: ParallelTicker()(world_grid) advances one tick.
+    Call close() to shut the worker processes down.
+    """
+
+    def __init__(self, workers: int = 0):
+        self.workers = workers or os.cpu_count() or 1
+        self._ctx = mp.get_context("spawn")
+        self._conns = []
+        self._procs = []
+        self._shm = None
+        # the grid's stock while it lives in self._shm
+        self._view = None
+        self._version = None
+        self._grid = None
+        self._local: List[Producer] = []
+        self._busy: List = []
+
+    def _start(self):
+        for _ in range(self.workers):
+            parent, child = self._ctx.Pipe()
+            proc = self._ctx.Process(target=_worker, args=(child,), daemon=True)
+            proc.start()
+            self._conns.append(parent)
+            self._procs.append(proc)
+
+    def _lend(self, world_grid):
+        """
+        Move the grid's stock into the shared buffer and let the grid use
+        a view of it from now on.
+        """
+        n = len(world_grid.stock) * 8
+        self._shm.buf[:n] = memoryview(world_grid.stock).cast("B")
+        self._view = self._shm.buf[:n].cast("q")
+        world_grid.stock = self._view
+
+    def _reclaim(self):
+        """
+        Give the grid an array of its own again, so the buffer can be
+        replaced or freed.
+        """
+        if self._view is None:
+            return
+        if self._grid is not None and self._grid.stock is self._view:
+            stock = array("q")
+            stock.frombytes(self._view.cast("B"))
+            self._grid.stock = stock
+        self._view.release()
+        self._view = None
+
+    def _plan(self, world_grid):
+        self._reclaim()
+        shards = build_shards(world_grid)
+        total = sum(len(s) for s in shards)
+        self._busy = []
+        if total < MIN_PARALLEL_PRODUCERS or len(shards) < 2:
+            # not worth farming out; keep the same shard order locally
+            self._local = [p for s in shards for p in s]
+            return
+        self._local = []
+        if not self._procs:
+            self._start()
+        size = max(len(world_grid.stock), 1) * 8
+        if self._shm is None or self._shm.size < size:
+            if self._shm is not None:
+                self._shm.close()
+                self._shm.unlink()
+            self._shm = shared_memory.SharedMemory(create=True, size=size * 2)
+        # largest shards first onto the least loaded worker
+        loads = [[] for _ in self._conns]
+        for shard in sorted(shards, key=len, reverse=True):
+            min(loads, key=len).extend(shard)
+        for conn, prods in zip(self._conns, loads):
+            conn.send(("plan", self._shm.name, prods))
+            if prods:
+                self._busy.append(conn)
+
+    def __call__(self, world_grid):
+        if world_grid is not self._grid or world_grid.version != self._version:
+            self._plan(world_grid)
+            self._grid = world_grid
+            self._version = world_grid.version
+        totals = world_grid.ledger.stock
+        if not self._busy:
+            run_producers(self._local, world_grid.stock, totals)
+            return
+
+        if world_grid.stock is not self._view:
+            self._lend(world_grid)
+        for conn in self._busy:
+            conn.send(("tick",))
+        for conn in self._busy:
+            for r, delta in enumerate(conn.recv()):
+                totals[r] += delta
+
+    def close(self):
+        self._reclaim()
+        for conn in self._conns:
+            conn.send(("stop",))
+        for proc in self._procs:
+            proc.join()
+        self._conns, self._procs = [], []
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
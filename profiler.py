@@ -0,0 +1,145 @@
+"""
+Named timing scopes for finding where frame and tick time goes.
+
+    with profiler.scope("draw_grid"):
+        render.draw_grid(...)
+
+Scopes record nothing unless `enabled` is set; a disabled scope costs
+a function call and an empty `with`. Recorded spans are kept in a bounded
+buffer for export as a Chrome trace (chrome://tracing or Perfetto), and
+the last few durations of every scope are kept for the in-game overlay.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, Tuple
+
+enabled = False
+
+MAX_EVENTS = 200_000  # spans kept for export, oldest dropped first
+HISTORY = 240  # durations kept per scope for histograms
+
+# (name, thread id, start s, duration s)
+_events: Deque[Tuple[str, int, float, float]] = deque(maxlen=MAX_EVENTS)
+_recent: Dict[str, Deque[float]] = {}
+_threads: Dict[int, str] = {}
+
+
+class _Scope:
+    __slots__ = ("name", "t0")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, self.t0, time.perf_counter() - self.t0)
+
+
+class _NullScope:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NULL = _NullScope()
+
+
+def scope(name: str):
+    return _Scope(name) if enabled else _NULL
+
+
+def start() -> float:
+    """
+    Start time for a span closed by stop(); for blocks too long to indent
+    under a `with`.
+    """
+    return time.perf_counter() if enabled else 0.0
+
+
+def stop(name: str, t0: float):
+    if enabled and t0:
+        record(name, t0, time.perf_counter() - t0)
+
+
+def record(name: str, t0: float, duration: float):
+    tid = threading.get_ident()
+    if tid not in _threads:
+        _threads[tid] = threading.current_thread().name
+    _events.append((name, tid, t0, duration))
+    recent = _recent.get(name)
+    if recent is None:
+        recent = _recent.setdefault(name, deque(maxlen=HISTORY))
+    recent.append(duration)
+
+
+def set_enabled(on: bool):
+    global enabled
+    enabled = on
+
+
+def clear():
+    _events.clear()
+    _recent.clear()
+
+
+def recent(name: str) -> List[float]:
+    """
+    The last HISTORY durations (s) of a scope, oldest first.
+    """
+    return list(_recent.get(name, ()))
+
+
+def names() -> List[str]:
+    return sorted(_recent)
+
+
+def histogram(name: str, edges_ms: List[float]) -> List[int]:
+    """
+    Counts of recent durations per bucket: below edges_ms[0], between
+    consecutive edges, and from the last edge up.
+    """
+    counts = [0] * (len(edges_ms) + 1)
+    for d in recent(name):
+        ms = d * 1000
+        i = 0
+        while i < len(edges_ms) and ms >= edges_ms[i]:
+            i += 1
+        counts[i] += 1
+    return counts
+
+
+def chrome_trace() -> dict:
+    pid = os.getpid()
+    events = [
+        {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": n}}
+        for tid, n in _threads.items()
+    ]
+    events.extend(
+        {
+            "name": name,
+            "ph": "X",
+            "pid": pid,
+            "tid": tid,
+            "ts": t0 * 1e6,
+            "dur": duration * 1e6,
+        }
+        for name, tid, t0, duration in list(_events)
+    )
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def export(path: str):
+    """
+    Write the recorded spans as Chrome trace JSON.
+    """
+    with open(path, "w") as f:
+        json.dump(chrome_trace(), f)
@@ -0,0 +1,288 @@
+"""
+Session recordings and headless replay for performance regression runs.
+
+While recording, the simulation driver writes every edit, tool switch and
+tick to a JSON-lines file, each stamped with the tick it happened at,
+next to a snapshot of the world as it was when recording started:
+
+    python recording.py session.rec --save-baseline
+    python recording.py session.rec
+
+replays the session against the current code with pygame's dummy video
+driver, timing each tick, each edit and the redraw after each, and
+compares the timings with the stored baseline. Any metric more than
+--tolerance slower than the baseline is reported as a regression and the
+exit status is 1. So is a replay that ends in a different world state,
+since its timings no longer measure the same work.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from typing import Callable, List
+
+import config
+import headless
+import savefile
+import sim
+import world
+
+FORMAT_VERSION = 1
+# metrics under this many ms are noise and never flagged
+MIN_REGRESSION_MS = 0.05
+
+
+def snapshot_path(path: str) -> str:
+    return path + ".sav"
+
+
+def baseline_path(path: str) -> str:
+    return path + ".baseline.json"
+
+
+class Recorder:
+    """
+    Appends one JSON object per event to `path`. Runs of ticks are stored
+    as one {"op": "tick", "n": count} record. Call from the thread that
+    owns the grid, so the snapshot and the order of records match what
+    the world went through.
+    """
+
+    def __init__(self, path: str, world_grid: world.Grid, tick: int = 0):
+        self.path = path
+        self.tick = tick
+        self.pending_ticks = 0
+        self._lock = threading.Lock()
+        savefile.save(snapshot_path(path), world_grid, tick)
+        self._file = open(path, "w")
+        self._write(
+            {
+                "format": FORMAT_VERSION,
+                "width": world_grid.width,
+                "height": world_grid.height,
+                "tick": tick,
+            }
+        )
+
+    def _write(self, rec: dict):
+        self._file.write(json.dumps(rec, separators=(",", ":")) + "\n")
+
+    def record(self, name: str, *args):
+        with self._lock:
+            if name == "tick":
+                self.pending_ticks += 1
+                return
+            self._flush_ticks()
+            self._write({"t": self.tick, "op": name, "args": args})
+
+    def _flush_ticks(self):
+        if self.pending_ticks:
+            self._write({"t": self.tick, "op": "tick", "n": self.pending_ticks})
+            self.tick += self.pending_ticks
+            self.pending_ticks = 0
+
+    def close(self):
+        with self._lock:
+            self._flush_ticks()
+            self._file.close()
+
+
+def read(path: str):
+    """
+    (header, records) of a recording.
+    """
+    with open(path) as f:
+        lines = [json.loads(line) for line in f if line.strip()]
+    if not lines or lines[0].get("format") != FORMAT_VERSION:
+        raise ValueError(f"{path}: not a recording")
+    return lines[0], lines[1:]
+
+
+def checksum(world_grid: world.Grid) -> str:
+    """
+    Digest of everything a replay should reproduce exactly.
+    """
+    h = hashlib.sha256()
+    for key in sorted(world_grid.chunks):
+        chunk = world_grid.chunks[key]
+        h.update(repr(key).encode())
+        h.update(chunk.terrains.tobytes())
+        h.update(chunk.buildings.tobytes())
+        h.update(chunk.levels.tobytes())
+    for pos in sorted(world_grid.slots):
+        h.update(repr(pos).encode())
+        base = world_grid.slots[pos] * world.NUM_RESOURCES
+        h.update(world_grid.stock[base : base + world.NUM_RESOURCES].tobytes())
+    return h.hexdigest()[:16]
+
+
+def _ms(samples: List[float], pct: float) -> float:
+    return round(headless.percentile(samples, pct) * 1000, 4)
+
+
+def replay(
+    path: str,
+    tick: Callable = world.simulate_tick,
+    draw: bool = True,
+    window=(1000, 700),
+) -> dict:
+    """
+    Replay a recording from its snapshot; returns the timings and the final
+    state's checksum. With `draw`, the world layer is redrawn onto a dummy
+    display after every record, with the map fitted to `window` the way
+    main.py shows it before any pan or zoom.
+    """
+    header, records = read(path)
+    g, _, _ = savefile.load(snapshot_path(path))
+    screen = None
+    if draw:
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        import pygame
+
+        import render
+
+        pygame.display.init()
+        screen = pygame.display.set_mode(window)
+        config.MAP_WIDTH, config.MAP_HEIGHT = g.width, g.height
+        camera = render.Camera()
+        camera.update(window[0] - config.PANEL_WIDTH, window[1])
+        view = camera.view()
+
+    ticks: List[float] = []
+    edits: List[float] = []
+    draws: List[float] = []
+    clock = time.perf_counter
+    t_start = clock()
+    try:
+        for rec in records:
+            op = rec["op"]
+            if op == "tick":
+                for _ in range(rec["n"]):
+                    t0 = clock()
+                    tick(g)
+                    ticks.append(clock() - t0)
+            elif op == "select_tool":
+                world.set_selected_tool(*rec["args"])
+                continue
+            elif op in sim.COMMANDS:
+                args = [
+                    [tuple(c) for c in a] if isinstance(a, list) else a
+                    for a in rec["args"]
+                ]
+                t0 = clock()
+                sim.COMMANDS[op](g, *args)
+                edits.append(clock() - t0)
+            else:
+                raise ValueError(f"{path}: unknown op {op!r}")
+            if screen is not None:
+                t0 = clock()
+                render.draw_grid(screen, g, *view)
+                pygame.display.flip()
+                draws.append(clock() - t0)
+    finally:
+        if screen is not None:
+            pygame.display.quit()
+    total = clock() - t_start
+
+    return {
+        "ticks": len(ticks),
+        "edits": len(edits),
+        "checksum": checksum(g),
+        "metrics": {
+            "total_ms": round(total * 1000, 2),
+            "tick_p50_ms": _ms(ticks, 50),
+            "tick_p90_ms": _ms(ticks, 90),
+            "tick_p99_ms": _ms(ticks, 99),
+            "edit_p50_ms": _ms(edits, 50),
+            "edit_p90_ms": _ms(edits, 90),
+            "draw_p50_ms": _ms(draws, 50),
+            "draw_p90_ms": _ms(draws, 90),
+        },
+    }
+
+
+def best_of(runs: List[dict]) -> dict:
+    """
+    The fastest value of every metric over several replays of the same
+    recording; the minimum is the least noisy estimate of the real cost.
+    """
+    result = dict(runs[0])
+    result["metrics"] = {
+        k: min(r["metrics"][k] for r in runs) for k in runs[0]["metrics"]
+    }
+    return result
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> List[str]:
+    """
+    A line per regression of `current` against `baseline`; empty if none.
+    """
+    problems = []
+    if current["checksum"] != baseline["checksum"]:
+        problems.append(
+            f"final state differs from the baseline "
+            f"({current['checksum']} != {baseline['checksum']})"
+        )
+    for key, old in baseline["metrics"].items():
+        new = current["metrics"].get(key)
+        if new is None:
+            continue
+        if new > old * (1 + tolerance) and new - old > MIN_REGRESSION_MS:
+            problems.append(f"{key}: {new:.3f} vs {old:.3f} (+{new / old - 1:.0%})")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("recording")
+    parser.add_argument("--baseline", help="default: RECORDING.baseline.json")
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="store this run as the baseline instead of comparing",
+    )
+    parser.add_argument(
+        "--engine", choices=["serial", "batch", "parallel", "events"], default="serial"
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--no-draw", action="store_true")
+    args = parser.parse_args(argv)
+
+    runs = []
+    for _ in range(args.repeat):
+        tick = headless.get_engine(args.engine)
+        try:
+            runs.append(replay(args.recording, tick, not args.no_draw))
+        finally:
+            if hasattr(tick, "close"):
+                tick.close()
+    current = best_of(runs)
+    current["engine"] = args.engine
+    print(f"{current['ticks']} ticks, {current['edits']} edits")
+    for key, value in current["metrics"].items():
+        print(f"  {key:<12} {value:>10.3f}")
+
+    path = args.baseline or baseline_path(args.recording)
+    if args.save_baseline:
+        with open(path, "w") as f:
+            json.dump(current, f, indent=1)
+        print(f"baseline saved to {path}")
+        return 0
+
+    with open(path) as f:
+        baseline = json.load(f)
+    problems = compare(current, baseline, args.tolerance)
+    for line in problems:
+        print("REGRESSION " + line)
+    if not problems:
+        print("no regressions")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
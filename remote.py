@@ -0,0 +1,510 @@
+"""
+Authoritative simulation server and the client that mirrors it.
+
+    python remote.py --port 5025 --scenario chains --size 200
+    python main.py --connect 127.0.0.1:5025
+
+The server owns the world and runs it on a SimulationDriver. Clients send
+the same commands main.py submits locally, and receive the world as a
+stream of frames: a keyframe (the whole world as a savefile snapshot)
+when they join and every KEYFRAME_TICKS ticks, and in between a delta
+per published snapshot holding only the changed cells and how much the
+stock moved in the chests where it did; the changes are small numbers
+that compress far better than the stock itself. Both bandwidth and
+client work follow what changed, not the size of the map.
+
+Every frame is FRAME_HEADER followed by a zlib-compressed payload:
+    keyframe  savefile snapshot
+    delta     DELTA_HEADER, CELL * cells, CHEST * chests
+    command   JSON [name, args] (client to server)
+"""
+
+import argparse
+import json
+import socket
+import struct
+import threading
+import time
+import zlib
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+import config
+import mapgen
+import savefile
+import scheduler
+import sim
+import world
+
+KEYFRAME = 0
+DELTA = 1
+COMMAND = 2
+
+# kind, payload bytes
+FRAME_HEADER = struct.Struct("<BI")
+# tick, speed, cells, chests
+DELTA_HEADER = struct.Struct("<QiII")
+# x, y, terrain code, building id, level
+CELL = struct.Struct("<IIBHI")
+# x, y, change in stock per resource
+CHEST = struct.Struct(f"<II{world.NUM_RESOURCES}q")
+
+# a keyframe goes out to every client this often, in ticks
+KEYFRAME_TICKS = 600
+
+# largest command frame a client may send, compressed or not
+MAX_COMMAND_BYTES = 8 << 20
+
+# what each command a client may send takes, by argument
+COMMAND_ARGS: Dict[str, Tuple[str, ...]] = {
+    "place_building": ("x", "y", "building"),
+    "place_terrain": ("x", "y", "terrain"),
+    "upgrade_tile": ("x", "y"),
+    "erase_tile": ("x", "y"),
+    "place_buildings": ("cells", "building"),
+    "place_terrains": ("cells", "terrain"),
+    "erase_tiles": ("cells",),
+    "set_speed": ("speed",),
+}
+
+Pos = Tuple[int, int]
+
+
+def send_frame(sock: socket.socket, kind: int, payload: bytes) -> int:
+    """
+    Send one frame; returns its size on the wire.
+    """
+    data = zlib.compress(payload, 1)
+    sock.sendall(FRAME_HEADER.pack(kind, len(data)) + data)
+    return FRAME_HEADER.size + len(data)
+
+
+def _recv_exactly(sock: socket.socket, n: int) -> Optional[bytes]:
+    buf = bytearray()
+    while len(buf) < n:
+        part = sock.recv(n - len(buf))
+        if not part:
+            return None
+        buf += part
+    return bytes(buf)
+
+
+def recv_frame(
+    sock: socket.socket, limit: Optional[int] = None
+) -> Optional[Tuple[int, bytes, int]]:
+    """
+    (kind, payload, size on the wire) of the next frame, or None once the
+    peer is gone. With a limit, a frame larger than that many bytes,
+    before or after decompression, raises ValueError.
+    """
+    header = _recv_exactly(sock, FRAME_HEADER.size)
+    if header is None:
+        return None
+    kind, size = FRAME_HEADER.unpack(header)
+    if limit is not None and size > limit:
+        raise ValueError(f"frame of {size} bytes")
+    data = _recv_exactly(sock, size)
+    if data is None:
+        return None
+    try:
+        if limit is None:
+            payload = zlib.decompress(data)
+        else:
+            inflate = zlib.decompressobj()
+            payload = inflate.decompress(data, limit)
+            if inflate.unconsumed_tail:
+                raise ValueError(f"frame over {limit} bytes unpacked")
+    except zlib.error as e:
+        raise ValueError(f"bad frame: {e}") from None
+    return kind, payload, FRAME_HEADER.size + size
+
+
+def _int(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def parse_command(payload: bytes, width: int, height: int) -> Tuple[str, list]:
+    """
+    A client's JSON [name, args] checked against COMMAND_ARGS and a width
+    x height map, as (name, args) ready for SimulationDriver.submit.
+    Raises ValueError for anything main.py could not have sent.
+    """
+    msg = json.loads(payload)
+    if not (isinstance(msg, list) and len(msg) == 2 and isinstance(msg[1], list)):
+        raise ValueError("command is not [name, args]")
+    name, args = msg
+    kinds = COMMAND_ARGS.get(name) if isinstance(name, str) else None
+    if kinds is None:
+        raise ValueError(f"unknown command {name!r}")
+    if len(args) != len(kinds):
+        raise ValueError(f"{name} takes {len(kinds)} arguments, got {len(args)}")
+    checked = []
+    for kind, arg in zip(kinds, args):
+        if kind == "x":
+            ok = _int(arg) and 0 <= arg < width
+        elif kind == "y":
+            ok = _int(arg) and 0 <= arg < height
+        elif kind == "building":
+            ok = _int(arg) and arg in world.BUILDINGS
+        elif kind == "terrain":
+            ok = isinstance(arg, str) and arg in world.TERRAIN_CODES
+        elif kind == "speed":
+            ok = _int(arg) and arg in config.SIM_SPEEDS
+        else:
+            # JSON turns cell tuples into lists
+            ok = (
+                isinstance(arg, list)
+                and len(arg) <= width * height
+                and all(
+                    isinstance(c, list)
+                    and len(c) == 2
+                    and _int(c[0])
+                    and _int(c[1])
+                    and 0 <= c[0] < width
+                    and 0 <= c[1] < height
+                    for c in arg
+                )
+            )
+            if ok:
+                arg = [tuple(c) for c in arg]
+        if not ok:
+            raise ValueError(f"{name}: bad {kind} argument")
+        checked.append(arg)
+    return name, checked
+
+
+def encode_delta(
+    prev: world.GridView, snap: sim.Snapshot, cells: Set[Pos], speed: int
+) -> bytes:
+    """
+    What a client holding `prev` needs to end up with `snap`: the given
+    cells, and the stock change of every chest where it differs.
+    """
+    parts = []
+    for x, y in sorted(cells):
+        parts.append(
+            CELL.pack(
+                x, y, snap.terrain_code(x, y), snap.building_id(x, y), snap.level(x, y)
+            )
+        )
+    chests = 0
+    R = world.NUM_RESOURCES
+    for pos, slot in snap.slots.items():
+        stock = snap.stock[slot * R : slot * R + R]
+        old = prev.slots.get(pos)
+        # a new chest starts empty
+        before = prev.stock[old * R : old * R + R] if old is not None else None
+        if before == stock or (before is None and not any(stock)):
+            continue
+        if before is not None:
+            stock = [v - b for v, b in zip(stock, before)]
+        parts.append(CHEST.pack(*pos, *stock))
+        chests += 1
+    header = DELTA_HEADER.pack(snap.tick, speed, len(cells), chests)
+    return header + b"".join(parts)
+
+
+def apply_delta(g: world.Grid, payload: bytes) -> Tuple[int, int, Set[Pos]]:
+    """
+    Apply an encoded delta to a mirror grid; returns (tick, speed, changed
+    cells). The mirror never ticks, so its network index is left alone.
+    """
+    tick, speed, ncells, nchests = DELTA_HEADER.unpack_from(payload)
+    pos = DELTA_HEADER.size
+    changed = set()
+    with g.batch():
+        for x, y, code, bid, lvl in CELL.iter_unpack(
+            payload[pos : pos + ncells * CELL.size]
+        ):
+            if g.terrain_code(x, y) != code:
+                g.set_terrain(x, y, world.TERRAINS_LIST[code].key)
+            if g.building_id(x, y) != bid:
+                g.set_building(x, y, world.BUILDING_TABLE[bid])
+            if bid and g.level(x, y) != lvl:
+                g.set_level(x, y, lvl)
+            changed.add((x, y))
+    pos += ncells * CELL.size
+    R = world.NUM_RESOURCES
+    totals = g.ledger.stock
+    for x, y, *moved in CHEST.iter_unpack(payload[pos : pos + nchests * CHEST.size]):
+        base = g.slots[(x, y)] * R
+        for r in range(R):
+            totals[r] += moved[r]
+            g.stock[base + r] += moved[r]
+    return tick, speed, changed
+
+
+def _cells_differing(old: world.GridView, new: world.GridView) -> Set[Pos]:
+    """
+    Cells whose terrain, building or level differ between two views.
+    """
+    size = world.CHUNK_SIZE
+    changed = set()
+    for key in old.chunks.keys() | new.chunks.keys():
+        a, b = old.chunks.get(key), new.chunks.get(key)
+        if (
+            a is not None
+            and b is not None
+            and a.terrains == b.terrains
+            and a.buildings == b.buildings
+            and a.levels == b.levels
+        ):
+            continue
+        x0, y0 = key[0] * size, key[1] * size
+        for i in range(size * size):
+            x, y = x0 + i % size, y0 + i // size
+            if (old.terrain_code(x, y), old.building_id(x, y)) != (
+                new.terrain_code(x, y),
+                new.building_id(x, y),
+            ) or old.level(x, y) != new.level(x, y):
+                changed.add((x, y))
+    return changed
+
+
+class Server:
+    """
+    Runs a world on a SimulationDriver and streams it to every client
+    connected to (host, port); port 0 picks a free one.
+    """
+
+    def __init__(
+        self,
+        grid: world.Grid,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        ticks: int = 0,
+        autosave=None,
+    ):
+        self.driver = sim.SimulationDriver(
+            grid, scheduler.EventTicker(), autosave=autosave, ticks=ticks
+        )
+        self.sock = socket.create_server((host, port))
+        self.address = self.sock.getsockname()
+        self._lock = threading.Lock()
+        self._joining: List[socket.socket] = []
+        self._clients: List[socket.socket] = []
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        # bytes sent on the wire, for benchmarks
+        self.sent = 0
+
+    def start(self):
+        self.driver.start()
+        for target in (self._accept, self._broadcast):
+            t = threading.Thread(target=target, daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self):
+        self._stop.set()
+        try:
+            # wakes the accept() in _accept
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+        for t in self._threads:
+            t.join()
+        with self._lock:
+            for conn in self._clients + self._joining:
+                conn.close()
+        self.driver.stop()
+
+    def _accept(self):
+        while not self._stop.is_set():
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with self._lock:
+                self._joining.append(conn)
+            threading.Thread(target=self._read, args=(conn,), daemon=True).start()
+
+    def _read(self, conn: socket.socket):
+        # one thread per client, feeding its commands to the driver; a
+        # client that sends anything malformed is dropped
+        grid = self.driver.grid
+        while True:
+            try:
+                frame = recv_frame(conn, MAX_COMMAND_BYTES)
+                if frame is None or frame[0] != COMMAND:
+                    break
+                name, args = parse_command(frame[1], grid.width, grid.height)
+            except (OSError, ValueError):
+                break
+            if name == "set_speed":
+                self.driver.set_speed(*args)
+            else:
+                self.driver.submit(name, *args)
+        self._drop(conn)
+
+    def _drop(self, conn: socket.socket):
+        with self._lock:
+            for conns in (self._clients, self._joining):
+                if conn in conns:
+                    conns.remove(conn)
+        conn.close()
+
+    def _send(self, conns: List[socket.socket], kind: int, payload: bytes):
+        for conn in conns:
+            try:
+                self.sent += send_frame(conn, kind, payload)
+            except OSError:
+                self._drop(conn)
+
+    def _broadcast(self):
+        prev, _ = self.driver.latest()
+        last_key = prev.tick
+        period = 1 / config.SNAPSHOT_HZ
+        while not self._stop.wait(period):
+            snap, changed = self.driver.latest()
+            with self._lock:
+                joining, self._joining = self._joining, []
+                clients = list(self._clients)
+                self._clients.extend(joining)
+            if snap is not prev:
+                if snap.tick - last_key >= KEYFRAME_TICKS:
+                    self._send(clients, KEYFRAME, savefile.dumps(snap, snap.tick))
+                    last_key = snap.tick
+                else:
+                    delta = encode_delta(prev, snap, changed, self.driver.speed)
+                    self._send(clients, DELTA, delta)
+                prev = snap
+            if joining:
+                self._send(joining, KEYFRAME, savefile.dumps(snap, snap.tick))
+
+
+class RemoteDriver:
+    """
+    Stands in for sim.SimulationDriver in main.py: commands go to a Server
+    and snapshots come from a local mirror of its world.
+    """
+
+    def __init__(self, host: str, port: int):
+        self.sock = socket.create_connection((host, port))
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.speed = 1
+        self._lock = threading.Lock()
+        self._taken: Set[Pos] = set()
+        self._thread: Optional[threading.Thread] = None
+        # bytes received on the wire, for benchmarks
+        self.received = 0
+        # as SimulationDriver.on_publish; called on the receiving thread
+        self.on_publish: Optional[Callable[[], None]] = None
+        # the first frame is always a keyframe
+        kind, payload, self.received = recv_frame(self.sock)
+        self.mirror, self.ticks, _ = savefile.loads(payload)
+        self._front = sim.Snapshot(self.mirror, self.ticks, None)
+
+    @property
+    def width(self) -> int:
+        return self.mirror.width
+
+    @property
+    def height(self) -> int:
+        return self.mirror.height
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+        if self._thread:
+            self._thread.join()
+
+    def _command(self, name: str, args):
+        send_frame(self.sock, COMMAND, json.dumps([name, args]).encode())
+
+    def submit(self, name: str, *args):
+        self._command(name, args)
+
+    def set_speed(self, speed: int):
+        self.speed = speed
+        self._command("set_speed", (speed,))
+
+    def show_rates(self, show: bool):
+        pass  # rates are solved on the server side only
+
+    def record(self, path: Optional[str]):
+        pass  # record on the server instead
+
+    def note(self, name: str, *args):
+        pass
+
+    def latest(self) -> Tuple[sim.Snapshot, Set[Pos]]:
+        with self._lock:
+            changed, self._taken = self._taken, set()
+            return self._front, changed
+
+    def _run(self):
+        while True:
+            try:
+                frame = recv_frame(self.sock)
+            except OSError:
+                frame = None
+            if frame is None:
+                return
+            kind, payload, size = frame
+            self.received += size
+            if kind == KEYFRAME:
+                grid, self.ticks, _ = savefile.loads(payload)
+                changed = _cells_differing(self.mirror, grid)
+                self.mirror = grid
+                base = None
+            elif kind == DELTA:
+                self.ticks, self.speed, changed = apply_delta(self.mirror, payload)
+                base = self._front
+            else:
+                continue
+            snap = sim.Snapshot(self.mirror, self.ticks, base, changed)
+            with self._lock:
+                self._front = snap
+                self._taken |= changed
+            if self.on_publish:
+                self.on_publish()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5025)
+    parser.add_argument(
+        "--save", help="resume and autosave this save file instead of generating"
+    )
+    parser.add_argument("--scenario", choices=list(mapgen.GENERATORS))
+    parser.add_argument("--size", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    ticks, autosave = 0, None
+    if args.save:
+        saved = savefile.resume(args.save)
+        if saved:
+            grid, ticks = saved
+        else:
+            grid = world.init_world(config.MAP_WIDTH, config.MAP_HEIGHT)
+        autosave = savefile.Autosave(args.save, grid, ticks)
+    elif args.scenario:
+        grid = mapgen.GENERATORS[args.scenario](args.size, args.size, args.seed)
+    else:
+        grid = world.init_world(config.MAP_WIDTH, config.MAP_HEIGHT)
+
+    server = Server(grid, args.host, args.port, ticks, autosave)
+    server.start()
+    print(f"serving on {server.address[0]}:{server.address[1]}", flush=True)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,10 @@
+import json
+import math
+import os
+from collections import OrderedDict
 import pygame, world, config
+import profiler
+import texture
 
 # unpack config
 MARGIN_RATIO = config.TILE_MARGIN_RATIO
@@ -20,29 +26,124 @@ def calculate_scaling(sw: int, sh: int):
     return int(tile_w), int(tile_h), int(ox), int(oy)
 
 
+class Camera:
+    """
+    Pan/zoom state for the map view. Until the player pans or zooms, the
+    camera keeps fitting the whole map with calculate_scaling; after that
+    it holds its own tile width and origin.
+    """
+
+    def __init__(self):
+        self.tile_w = 0.0
+        self.ox = 0.0
+        self.oy = 0.0
+        self.fitted = True
+        self.size = None
+
+    def update(self, sw: int, sh: int):
+        if self.fitted and self.size != (sw, sh):
+            self.fit(sw, sh)
+        self.size = (sw, sh)
+
+    def fit(self, sw: int, sh: int):
+        tw, _, ox, oy = calculate_scaling(sw, sh)
+        self.tile_w, self.ox, self.oy = float(tw), float(ox), float(oy)
+        self.fitted = True
+
+    def pan(self, dx: float, dy: float):
+        self.ox += dx
+        self.oy += dy
+        self.fitted = False
+
+    def zoom_at(self, factor: float, mx: int, my: int):
+        """
+        Scale the tiles around the screen point (mx, my), keeping the map
+        position under it fixed.
+        """
+        tile_w = self.tile_w * factor
+        tile_w = min(max(tile_w, config.MIN_TILE_WIDTH), config.MAX_TILE_WIDTH)
+        if tile_w == self.tile_w:
+            return
+        if self.tile_w <= 0:
+            self.tile_w = tile_w
+            return
+        k = tile_w / self.tile_w
+        self.ox = mx - (mx - self.ox) * k
+        self.oy = my - (my - self.oy) * k
+        self.tile_w = tile_w
+        self.fitted = False
+
+    def view(self):
+        """
+        The (tw, th, ox, oy) transform used by grid_to_screen and friends.
+        """
+        return int(self.tile_w), int(self.tile_w / 2), int(self.ox), int(self.oy)
+
+
+def visible_cells(sw, sh, tw, th, ox, oy, mw, mh):
+    """
+    Yield, in row-major order, the cells whose sprite overlaps the
+    (0, 0, sw, sh) screen rect.
+    """
+    if tw <= 0 or th <= 0:
+        return
+    # a sprite spans [px, px + tw] x [py, py + 1.5 th]; with u = x - y and
+    # v = x + y that bounds u and v independently
+    u_min = math.floor((-tw - ox) * 2 / tw)
+    u_max = math.ceil((sw - ox) * 2 / tw)
+    v_min = math.floor((-1.5 * th - oy) * 2 / th)
+    v_max = math.ceil((sh - oy) * 2 / th)
+    y_lo = max(0, (v_min - u_max) // 2)
+    y_hi = min(mh - 1, (v_max - u_min + 1) // 2)
+    for yy in range(y_lo, y_hi + 1):
+        x_lo = max(0, yy + u_min, v_min - yy)
+        x_hi = min(mw - 1, yy + u_max, v_max - yy)
+        for xx in range(x_lo, x_hi + 1):
+            yield xx, yy
+
+
 def grid_to_screen(x: int, y: int, tw: int, th: int, ox: int, oy: int):
     px = (x - y) * tw // 2 + ox
     py = (x + y) * th // 2 + oy
     return px, py
 
 
+def tile_rect(x, y, tw, th, ox, oy):
+    """
+    Screen rect covering the tile at (x, y) and its highlight outline.
+    """
+    px, py = grid_to_screen(x, y, tw, th, ox, oy)
+    return pygame.Rect(px - 2, py - 2, tw + 4, th + 4)
+
+
 def point_in_diamond(mx, my, px, py, tw, th):
     dx = abs(mx - (px + tw / 2))
     dy = abs(my - (py + th / 2))
     return (dx / (tw / 2) + dy / (th / 2)) <= 1
 
 
-def find_clicked_tile(mx, my, tw, th, ox, oy):
-    mw, mh = config.MAP_WIDTH, config.MAP_HEIGHT
-    for yy in range(mh):
-        for xx in range(mw):
+def find_clicked_tile(mx, my, tw, th, ox, oy, mw, mh):
+    """
+    Invert grid_to_screen to get the nearest cell of the mw x mh map, then
+    test the few cells around it. Diamonds share their edges, so of the
+    cells that contain the point the first in row-major order wins, as in
+    a full scan.
+    """
+    if tw <= 0 or th <= 0:
+        return None, None
+    u = (mx - ox - tw / 2) / (tw / 2)  # x - y
+    v = (my - oy - th / 2) / (th / 2)  # x + y
+    gx = math.floor((u + v) / 2)
+    gy = math.floor((v - u) / 2)
+    for yy in range(max(gy - 1, 0), min(gy + 3, mh)):
+        for xx in range(max(gx - 1, 0), min(gx + 3, mw)):
             px, py = grid_to_screen(xx, yy, tw, th, ox, oy)
             if point_in_diamond(mx, my, px, py, tw, th):
                 return xx, yy
     return None, None
 
 
-def draw_block(screen, x, y, cell, tw, th, ox, oy):
+def draw_block(screen, x, y, terrain_code, bid, tw, th, ox, oy):
     px, py = grid_to_screen(x, y, tw, th, ox, oy)
     side_h = th // 2
 
@@ -56,8 +157,7 @@ def draw_block(screen, x, y, cell, tw, th, ox, oy):
     cx, cy = px + tw // 2, py + th // 2
 
     # get base color
-    terrain = world.TERRAINS[cell["terrain"]]
-    base_col = terrain.color
+    base_col = world.TERRAIN_COLORS[terrain_code]
 
     # choose facet multipliers (light from top-left)
     # order: top→right→bottom→left
@@ -95,35 +195,213 @@ def draw_block(screen, x, y, cell, tw, th, ox, oy):
         col = tuple(int(c * m) for c in base_col)
         pygame.draw.polygon(screen, col, pts)
 
+    # texture file over the top face, if there is one
+    img = texture.image(world.TERRAINS_LIST[terrain_code].key)
+    if img is not None:
+        texture.blit_diamond(screen, img, pygame.Rect(px, py, tw, th))
+
     # outline
     pygame.draw.polygon(screen, OUTLINE_COLOR, [top, right, bottom, left], width=1)
 
-    # building icon (unchanged)
-    bld = cell["building"]
-    if bld:
-        icon_cx = px + tw // 2
-        icon_cy = py + th // 2
-        sz = tw // 4
-        if bld.shape == "square":
-            h = sz // 2
-            pygame.draw.rect(
-                screen, bld.color, (icon_cx - h, icon_cy - h, 2 * h, 2 * h)
-            )
-        elif bld.shape == "circle":
-            pygame.draw.circle(screen, bld.color, (icon_cx, icon_cy), sz // 2)
-        elif bld.shape == "triangle":
-            pts = [
-                (icon_cx, icon_cy - sz),
-                (icon_cx - sz, icon_cy + sz),
-                (icon_cx + sz, icon_cy + sz),
-            ]
-            pygame.draw.polygon(screen, bld.color, pts)
+    texture.draw_building_icon(screen, bid, px + tw // 2, py + th // 2, tw // 4)
+
+
+# Every tile pre-rendered at the current tile size; rebuilt when the tile
+# size changes (window resize or zoom)
+_atlas = None
+
+
+def tile_sprite(terrain_code, bid, tw, th):
+    global _atlas
+    if _atlas is None or _atlas.size != (tw, th):
+        _atlas = texture.Atlas(tw, th, draw_block)
+    return _atlas.tiles[terrain_code][bid]
+
+
+_icons = None
+
+
+def tool_icon(i):
+    """
+    world.TOOLS[i]'s palette icon, config.ICON_SIZE square.
+    """
+    global _icons
+    if _icons is None or _icons.size != config.ICON_SIZE:
+        _icons = texture.IconSheet(config.ICON_SIZE)
+    return _icons.icons[i]
+
+
+# Past this many changed cells a frame repaints the whole layer
+REDRAW_LIMIT = 64
+
+
+class WorldLayer:
+    """
+    The grid drawn once onto an off-screen surface. Cells reported by the
+    grid's listeners (or, for simulation snapshots, the changed cells handed
+    over with each one) are redrawn in place; a full rebuild only happens
+    when the screen size or scaling changes.
+    """
+
+    def __init__(self):
+        self.surface = None
+        self.grid = None
+        self.view = None
+        self.dirty = set()
 
+    def _mark(self, x, y):
+        self.dirty.add((x, y))
 
-def draw_grid(screen, tile_data, tw, th, ox, oy):
-    for yy, row in enumerate(tile_data):
-        for xx, cell in enumerate(row):
-            draw_block(screen, xx, yy, cell, tw, th, ox, oy)
+    def _unbind(self):
+        if self.grid is not None and hasattr(self.grid, "listeners"):
+            self.grid.listeners.remove(self._mark)
+
+    def bind(self, tile_data):
+        if self.grid is tile_data:
+            return
+        self._unbind()
+        self.grid = tile_data
+        tile_data.listeners.append(self._mark)
+        self.view = None
+
+    def follow(self, snapshot, changed):
+        """
+        Move on to the next snapshot of the same world.
+        """
+        if self.grid is None or hasattr(self.grid, "listeners"):
+            self._unbind()
+            self.view = None
+        self.grid = snapshot
+        self.dirty |= changed
+
+    def _blit_tile(self, x, y, tw, th, ox, oy):
+        g = self.grid
+        sprite = tile_sprite(g.terrain_code(x, y), g.building_id(x, y), tw, th)
+        self.surface.blit(sprite, grid_to_screen(x, y, tw, th, ox, oy))
+
+    def _rebuild(self, size, tw, th, ox, oy):
+        if self.surface is None or self.surface.get_size() != size:
+            self.surface = pygame.Surface(size)
+        self.surface.fill(config.COLORS["background"])
+        g = self.grid
+        for xx, yy in visible_cells(*size, tw, th, ox, oy, g.width, g.height):
+            self._blit_tile(xx, yy, tw, th, ox, oy)
+
+    def _redraw(self, x, y, tw, th, ox, oy):
+        # Tiles overlap their neighbours (side faces hang below the diamond),
+        # so repaint everything touching this tile's sprite, clipped to it,
+        # in the same back-to-front order as a full draw.
+        px, py = grid_to_screen(x, y, tw, th, ox, oy)
+        rect = pygame.Rect(px, py, tw + 1, th + th // 2 + 1)
+        if not rect.colliderect(self.surface.get_rect()):
+            return
+        self.surface.set_clip(rect)
+        self.surface.fill(config.COLORS["background"])
+        for yy in range(y - 3, y + 4):
+            for xx in range(x - 3, x + 4):
+                if self.grid.in_bounds(xx, yy):
+                    self._blit_tile(xx, yy, tw, th, ox, oy)
+        self.surface.set_clip(None)
+
+    def draw(self, screen, tile_data, tw, th, ox, oy, changed=None):
+        if changed is None:
+            self.bind(tile_data)
+        else:
+            self.follow(tile_data, changed)
+        view = (screen.get_size(), tw, th, ox, oy)
+        if view != self.view:
+            self._rebuild(screen.get_size(), tw, th, ox, oy)
+            self.view = view
+            self.dirty.clear()
+        elif len(self.dirty) > REDRAW_LIMIT:
+            # an area edit: one full repaint beats thousands of patches
+            self._rebuild(screen.get_size(), tw, th, ox, oy)
+            self.dirty.clear()
+        elif self.dirty:
+            for x, y in self.dirty:
+                self._redraw(x, y, tw, th, ox, oy)
+            self.dirty.clear()
+        screen.blit(self.surface, (0, 0))
+
+
+_layer = WorldLayer()
+
+
+def draw_grid(screen, tile_data, tw, th, ox, oy, changed=None):
+    """
+    Draw a live Grid, or a sim.Snapshot together with the cells changed
+    since the previous one.
+    """
+    _layer.draw(screen, tile_data, tw, th, ox, oy, changed)
+
+
+class TextCache:
+    """
+    Bounded LRU cache of rendered text surfaces, keyed by
+    (text, color, antialias, font). hits/misses count lookups.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def render(self, font, text, antialias, color):
+        key = (text, tuple(color), antialias, font)
+        surface = self.entries.get(key)
+        if surface is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return surface
+        self.misses += 1
+        surface = font.render(text, antialias, color)
+        self.entries[key] = surface
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+        return surface
+
+
+text_cache = TextCache(config.TEXT_CACHE_SIZE)
+
+
+def load_font(name, size):
+    """
+    Like pygame.font.SysFont(name, size), but without SysFont's scan of
+    every installed font on each start: a name's resolved path is kept in
+    config.FONT_CACHE_PATH. None is pygame's bundled font and needs no
+    lookup at all.
+    """
+    if name is None:
+        return pygame.font.Font(None, size)
+    try:
+        with open(config.FONT_CACHE_PATH) as f:
+            paths = json.load(f)
+    except (OSError, ValueError):
+        paths = {}
+    path = paths.get(name)
+    if path is None or not os.path.exists(path):
+        path = pygame.font.match_font(name)
+        if path:
+            paths[name] = path
+            try:
+                with open(config.FONT_CACHE_PATH, "w") as f:
+                    json.dump(paths, f)
+            except OSError:
+                pass
+    return pygame.font.Font(path, size)
+
+
+def render_text(font, text, color, antialias=True):
+    """
+    Cached stand-in for font.render(text, antialias, color).
+    """
+    return text_cache.render(font, text, antialias, color)
 
 
 def draw_highlight(screen, x, y, tw, th, ox, oy):
@@ -139,3 +417,63 @@ def draw_highlight(screen, x, y, tw, th, ox, oy):
         ],
         width=3,
     )
+
+
+# frame/tick histogram buckets for the profiler overlay, in ms
+OVERLAY_EDGES_MS = [1, 2, 4, 8, 16, 33, 66, 133]
+OVERLAY_BAR_W = 18
+OVERLAY_BAR_H = 40
+
+
+def _percentile_ms(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))] * 1000
+
+
+def draw_profile_overlay(screen, font, x, y):
+    """
+    Frame- and tick-time histograms plus the mean time of every other
+    profiler scope, drawn with the top-left corner at (x, y).
+    """
+    line_h = font.get_height() + 2
+    width = OVERLAY_BAR_W * (len(OVERLAY_EDGES_MS) + 1) + 160
+    others = [n for n in profiler.names() if n not in ("frame", "tick")]
+    height = 2 * (line_h + OVERLAY_BAR_H + 6) + (len(others) + 1) * line_h + 8
+    panel = pygame.Surface((width, height), pygame.SRCALPHA)
+    panel.fill((0, 0, 0, 190))
+    screen.blit(panel, (x, y))
+    x, y = x + 4, y + 4
+    white = (255, 255, 255)
+    for name, label in (("frame", "Frame"), ("tick", "Tick")):
+        samples = profiler.recent(name)
+        screen.blit(
+            render_text(
+                font,
+                f"{label} p50 {_percentile_ms(samples, 50):.1f} "
+                f"p99 {_percentile_ms(samples, 99):.1f} ms",
+                white,
+            ),
+            (x, y),
+        )
+        y += line_h
+        counts = profiler.histogram(name, OVERLAY_EDGES_MS)
+        top = max(counts) or 1
+        for i, count in enumerate(counts):
+            h = OVERLAY_BAR_H * count // top
+            pygame.draw.rect(
+                screen,
+                (120, 200, 120) if i < 5 else (230, 120, 80),
+                (x + i * OVERLAY_BAR_W, y + OVERLAY_BAR_H - h, OVERLAY_BAR_W - 2, h),
+            )
+        y += OVERLAY_BAR_H + 6
+    for name in others:
+        samples = profiler.recent(name)
+        mean = sum(samples) / len(samples) * 1000 if samples else 0.0
+        screen.blit(render_text(font, f"{name}: {mean:.2f} ms", white), (x, y))
+        y += line_h
+    screen.blit(
+        render_text(font, f"text cache hits: {text_cache.hit_rate:.0%}", white),
+        (x, y),
+    )
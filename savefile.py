@@ -0,0 +1,419 @@
+"""
+Binary save files and the autosave journal.
+
+A save is a full snapshot of the grid plus an append-only journal of
+everything that happened since: edits and ticks. Autosaving appends a
+few bytes per change instead of rewriting the map; once the journal gets
+long, a fresh snapshot replaces both. The simulation is deterministic,
+so replaying the journal's ticks restores chest stock exactly.
+
+Snapshot layout (little-endian, every section padded to 8 bytes so it
+can be used straight out of a memory map). Only allocated chunks are
+stored, so the file grows with what's built rather than the map's size:
+    header      SNAPSHOT_HEADER
+    resources   for each resource key: u8 length + utf-8 name
+    chunk keys  u32 * 2 * chunks      (cx, cy)
+    terrains    u8  * area * chunks   (world.TERRAIN_CODES)
+    buildings   u16 * area * chunks   (building ids, 0 = empty)
+    levels      u32 * area * chunks
+    chest cells u32 * 2 * chests      (x, y)
+    chest stock i64 * chests * resources, ordered like the header's keys
+where area is chunk size squared.
+
+Journal layout: JOURNAL_HEADER then RECORD entries. A journal belongs to
+the snapshot with the same generation and is ignored otherwise.
+"""
+
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from typing import List, Optional, Tuple
+
+import config
+import world
+
+FORMAT_VERSION = 2
+SNAPSHOT_MAGIC = b"BNRS"
+JOURNAL_MAGIC = b"BNRJ"
+
+# magic, version, resource count, chunk size, width, height, chunks,
+# chests, generation, tick
+SNAPSHOT_HEADER = struct.Struct("<4sHHHIIIIQQ")
+# magic, version, generation
+JOURNAL_HEADER = struct.Struct("<4sHQ")
+# op, arg, x, y; tick records keep their count in x
+RECORD = struct.Struct("<BHII")
+
+OPS = {
+    "tick": 0,
+    "update_tile": 1,
+    "place_building": 2,
+    "place_terrain": 3,
+    "upgrade_tile": 4,
+    "erase_tile": 5,
+}
+TICK = OPS["tick"]
+# area edits are journaled as the single-tile edit for each of their cells
+AREA_OPS = {
+    "place_buildings": "place_building",
+    "place_terrains": "place_terrain",
+    "erase_tiles": "erase_tile",
+}
+
+
+def _pad(n: int) -> int:
+    return -n % 8
+
+
+def _le(arr: array) -> bytes:
+    if sys.byteorder == "big":
+        arr = array(arr.typecode, arr)
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def _take(typecode: str, buf, start: int, count: int) -> Tuple[array, int]:
+    """
+    Copy `count` items out of buf; returns the array and the next
+    aligned offset.
+    """
+    arr = array(typecode)
+    end = start + count * arr.itemsize
+    arr.frombytes(buf[start:end])
+    if sys.byteorder == "big":
+        arr.byteswap()
+    return arr, end + _pad(end)
+
+
+# snapshots
+def save(path: str, world_grid: world.Grid, tick: int = 0, generation: int = 0):
+    """
+    Write a full snapshot atomically: a crash leaves the old file intact.
+    """
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(dumps(world_grid, tick, generation))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def dumps(world_grid: world.GridView, tick: int = 0, generation: int = 0) -> bytes:
+    """
+    A snapshot of the grid (or a sim.Snapshot of one) as bytes.
+    """
+    keys = sorted(world_grid.chunks)
+    chunks = [world_grid.chunks[k] for k in keys]
+    cells = sorted(world_grid.slots)
+    R = world.NUM_RESOURCES
+    stock = array("q")
+    for pos in cells:
+        base = world_grid.slots[pos] * R
+        stock.extend(world_grid.stock[base : base + R])
+
+    names = b"".join(bytes([len(k.encode())]) + k.encode() for k in world.RESOURCE_KEYS)
+    header = SNAPSHOT_HEADER.pack(
+        SNAPSHOT_MAGIC,
+        FORMAT_VERSION,
+        R,
+        world.CHUNK_SIZE,
+        world_grid.width,
+        world_grid.height,
+        len(keys),
+        len(cells),
+        generation,
+        tick,
+    )
+    sections = [
+        header + names,
+        _le(array("I", [c for key in keys for c in key])),
+        b"".join(c.terrains.tobytes() for c in chunks),
+        b"".join(_le(c.buildings) for c in chunks),
+        b"".join(_le(c.levels) for c in chunks),
+        _le(array("I", [c for pos in cells for c in pos])),
+        _le(stock),
+    ]
+    return b"".join(data + bytes(_pad(len(data))) for data in sections)
+
+
+def read_header(path: str) -> Tuple[int, int, int, int, int]:
+    """
+    (width, height, chests, generation, tick) without loading the map.
+    """
+    with open(path, "rb") as f:
+        data = f.read(SNAPSHOT_HEADER.size)
+    R, size, W, H, chunks, chests, gen, tick = _check_header(data)
+    return W, H, chests, gen, tick
+
+
+def _check_header(buf) -> Tuple[int, ...]:
+    if len(buf) < SNAPSHOT_HEADER.size:
+        raise ValueError("truncated save file")
+    magic, version, *fields = SNAPSHOT_HEADER.unpack_from(buf)
+    if magic != SNAPSHOT_MAGIC:
+        raise ValueError("not a save file")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"unsupported save format version {version}")
+    return tuple(fields)
+
+
+def load(path: str) -> Tuple[world.Grid, int, int]:
+    """
+    Read a snapshot; returns (grid, tick, generation). The file is memory
+    mapped and each section is copied out in one go, so load time is
+    dominated by rebuilding the derived indexes.
+    """
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        buf = memoryview(m)
+        try:
+            return loads(buf)
+        finally:
+            buf.release()
+
+
+def loads(buf) -> Tuple[world.Grid, int, int]:
+    """
+    load() for a snapshot already in memory (bytes or a memoryview).
+    """
+    R, size, W, H, K, C, generation, tick = _check_header(buf)
+    pos = SNAPSHOT_HEADER.size
+    keys: List[str] = []
+    for _ in range(R):
+        n = buf[pos]
+        keys.append(bytes(buf[pos + 1 : pos + 1 + n]).decode())
+        pos += 1 + n
+    pos += _pad(pos)
+
+    area = size * size
+    chunk_keys, pos = _take("I", buf, pos, 2 * K)
+    terrains, pos = _take("B", buf, pos, area * K)
+    buildings, pos = _take("H", buf, pos, area * K)
+    levels, pos = _take("I", buf, pos, area * K)
+    cells, pos = _take("I", buf, pos, 2 * C)
+    stock, pos = _take("q", buf, pos, C * R)
+    # the tick engines index their tables by building id and terrain code
+    if buildings and max(buildings) >= len(world.BUILDING_TABLE):
+        raise ValueError(f"unknown building id {max(buildings)}")
+    if terrains and max(terrains) >= len(world.TERRAINS_LIST):
+        raise ValueError(f"unknown terrain code {max(terrains)}")
+
+    g = world.Grid(W, H)
+    for k in range(K):
+        s = slice(k * area, (k + 1) * area)
+        key = (chunk_keys[2 * k], chunk_keys[2 * k + 1])
+        if size == world.CHUNK_SIZE:
+            chunk = world.Chunk()
+            chunk.terrains = terrains[s]
+            chunk.buildings = buildings[s]
+            chunk.levels = levels[s]
+            g.chunks[key] = chunk
+        else:
+            _rechunk(g, key, size, terrains[s], buildings[s], levels[s])
+    for chunk in g.chunks.values():
+        chunk.recount()
+
+    g.slots = {(cells[2 * s], cells[2 * s + 1]): s for s in range(C)}
+    if keys == world.RESOURCE_KEYS:
+        g.stock = stock
+    else:
+        # resources were added, removed or reordered since the save:
+        # match columns by key and drop the ones that no longer exist
+        g.stock = array("q", bytes(8 * C * world.NUM_RESOURCES))
+        for col, key in enumerate(keys):
+            r = world.RESOURCE_INDEX.get(key)
+            if r is None:
+                continue
+            for slot in range(C):
+                g.stock[slot * world.NUM_RESOURCES + r] = stock[slot * R + col]
+    g.reindex()
+    return g, tick, generation
+
+
+def _rechunk(g: world.Grid, key, size: int, terrains, buildings, levels):
+    # the save used another CHUNK_SIZE: copy its non-empty cells over
+    x0, y0 = key[0] * size, key[1] * size
+    for i in range(size * size):
+        if terrains[i] or buildings[i]:
+            _, chunk, j = g._cell(x0 + i % size, y0 + i // size, True)
+            chunk.terrains[j] = terrains[i]
+            chunk.buildings[j] = buildings[i]
+            chunk.levels[j] = levels[i]
+
+
+# journal
+def read_journal(path: str, generation: int) -> List[Tuple[int, int, int, int]]:
+    """
+    The journal's complete records, or [] if it belongs to another
+    snapshot. A torn record left by a crash mid-write is ignored.
+    """
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return []
+    if len(data) < JOURNAL_HEADER.size:
+        return []
+    magic, version, gen = JOURNAL_HEADER.unpack_from(data)
+    if magic != JOURNAL_MAGIC or version != FORMAT_VERSION or gen != generation:
+        return []
+    body = len(data) - JOURNAL_HEADER.size
+    end = JOURNAL_HEADER.size + body - body % RECORD.size
+    return list(RECORD.iter_unpack(data[JOURNAL_HEADER.size : end]))
+
+
+def replay(world_grid: world.Grid, records, tick_fn=world.simulate_tick) -> int:
+    """
+    Apply journal records to the grid; returns the number of ticks run.
+    """
+    ticks = 0
+    for op, arg, x, y in records:
+        if op == TICK:
+            for _ in range(x):
+                tick_fn(world_grid)
+            ticks += x
+        elif op == OPS["update_tile"]:
+            world.update_tile(world_grid, x, y, world.BUILDINGS.get(arg))
+        elif op == OPS["place_building"]:
+            world.place_building(world_grid, x, y, world.BUILDINGS[arg])
+        elif op == OPS["place_terrain"]:
+            world.place_terrain(world_grid, x, y, world.TERRAINS_LIST[arg].key)
+        elif op == OPS["upgrade_tile"]:
+            world.upgrade_tile(world_grid, x, y)
+        elif op == OPS["erase_tile"]:
+            world.erase_tile(world_grid, x, y)
+    return ticks
+
+
+def journal_path(path: str) -> str:
+    return path + ".journal"
+
+
+def resume(path: str, tick_fn=world.simulate_tick) -> Optional[Tuple[world.Grid, int]]:
+    """
+    Load the snapshot at path and replay its journal; returns (grid, tick)
+    or None if there is no save yet.
+    """
+    if not os.path.exists(path):
+        return None
+    g, tick, generation = load(path)
+    tick += replay(g, read_journal(journal_path(path), generation), tick_fn)
+    return g, tick
+
+
+class Autosave:
+    """
+    Journals edits and ticks for one grid. The grid must be the one that
+    resume() returned for this path, or a new world (which is snapshotted
+    straight away).
+
+    Records are buffered in memory; poll() writes them out every
+    config.AUTOSAVE_INTERVAL seconds and replaces snapshot + journal with
+    a fresh snapshot once the journal would take too long to replay.
+    """
+
+    def __init__(self, path: str, world_grid: world.Grid, tick: int = 0):
+        self.path = path
+        self.interval = config.AUTOSAVE_INTERVAL
+        self.pending = bytearray()
+        self.pending_ticks = 0
+        self.records = 0
+        self.journal_ticks = 0
+        self.generation = -1
+        self._file = None
+        self._last_flush = time.monotonic()
+        try:
+            generation = read_header(path)[3]
+        except (OSError, ValueError):
+            self.checkpoint(world_grid, tick)
+            return
+        self.generation = generation
+        records = read_journal(journal_path(path), generation)
+        self.records = len(records)
+        self.journal_ticks = sum(r[2] for r in records if r[0] == TICK)
+        self._open_journal(records)
+
+    def _open_journal(self, records):
+        # Start from a clean copy of the valid records, so a stale journal
+        # or a torn record at the end never sits in front of new appends.
+        jpath = journal_path(self.path)
+        with open(jpath + ".tmp", "wb") as f:
+            f.write(JOURNAL_HEADER.pack(JOURNAL_MAGIC, FORMAT_VERSION, self.generation))
+            for rec in records:
+                f.write(RECORD.pack(*rec))
+        os.replace(jpath + ".tmp", jpath)
+        self._file = open(jpath, "ab")
+
+    def record(self, name: str, *args):
+        if name == "tick":
+            self.pending_ticks += 1
+            return
+        if name in AREA_OPS:
+            # an area edit replays the same as its single-tile edits
+            cells, rest = args[0], args[1:]
+            for x, y in cells:
+                self.record(AREA_OPS[name], x, y, *rest)
+            return
+        self._flush_ticks()
+        x, y = args[0], args[1]
+        arg = 0
+        if name in ("update_tile", "place_building"):
+            # buildings may come as ids (sim commands) or Building objects
+            b = args[2]
+            arg = b if isinstance(b, int) else (b.id if b else 0)
+        elif name == "place_terrain":
+            arg = world.TERRAIN_CODES[args[2]]
+        self.pending += RECORD.pack(OPS[name], arg, x, y)
+        self.records += 1
+
+    def _flush_ticks(self):
+        if self.pending_ticks:
+            self.pending += RECORD.pack(TICK, 0, self.pending_ticks, 0)
+            self.records += 1
+            self.journal_ticks += self.pending_ticks
+            self.pending_ticks = 0
+
+    def poll(self, world_grid: world.Grid, tick: int):
+        """
+        Call regularly from the thread that owns the grid.
+        """
+        if time.monotonic() - self._last_flush < self.interval:
+            return
+        self._flush_ticks()
+        if (
+            self.records > config.JOURNAL_MAX_RECORDS
+            or self.journal_ticks > config.JOURNAL_MAX_TICKS
+        ):
+            self.checkpoint(world_grid, tick)
+        else:
+            self.flush()
+
+    def flush(self):
+        self._flush_ticks()
+        if self.pending:
+            self._file.write(self.pending)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.pending = bytearray()
+        self._last_flush = time.monotonic()
+
+    def checkpoint(self, world_grid: world.Grid, tick: int):
+        """
+        Write a full snapshot and start an empty journal for it.
+        """
+        if self._file is not None:
+            self._file.close()
+        self.generation += 1
+        save(self.path, world_grid, tick, self.generation)
+        self.pending = bytearray()
+        self.pending_ticks = 0
+        self.records = 0
+        self.journal_ticks = 0
+        self._open_journal([])
+        self._last_flush = time.monotonic()
+
+    def close(self, world_grid: world.Grid, tick: int):
+        self.checkpoint(world_grid, tick)
+        self._file.close()
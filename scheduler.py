@@ -0,0 +1,125 @@
+"""
+Event-driven tick engine: only producers that might fire are visited.
+
+A producer that finds no affordable chest can't fire again until one of
+the counters it compares goes up, since stock only rises when something
+deposits into it. Such a producer goes to sleep on those (chest,
+resource) counters, and a deposit into one wakes every producer sleeping
+on it. Woken producers behind the depositor in tick order still run in
+the same tick, the way the serial loop would reach them. The ones in
+front of it run in the next tick. Results match world.simulate_tick.
+
+Ticks cost time in proportion to the producers that fire or are woken,
+not to the size of the map.
+"""
+
+import heapq
+import time
+from typing import Dict, List, Set, Tuple
+
+import profiler
+import world
+
+# inputs as (resource index, amount), outputs likewise, chest offsets and
+# the counters to sleep on
+Step = Tuple[List[Tuple[int, int]], List[Tuple[int, int]], List[int], List[int]]
+
+
+def build_steps(world_grid) -> List[Step]:
+    """
+    Every producer with a reachable chest, in tick order, with the
+    counters it would sleep on.
+    """
+    steps = []
+    for _, _, bid, lvl, offs in world.producer_links(world_grid):
+        ins, outs = world.recipe(bid, lvl)
+        steps.append((ins, outs, offs, [base + r for base in offs for r, _ in ins]))
+    return steps
+
+
+class EventTicker:
+    """
+    Callable tick engine: EventTicker()(world_grid) advances one tick.
+
+    Who is asleep is only known for stock this ticker changed itself. It
+    re-plans after every edit, but anything else that adds stock between
+    ticks has to call reset() afterwards.
+    """
+
+    def __init__(self):
+        self._grid = None
+        self._version = None
+        self._steps: List[Step] = []
+        self._active: List[int] = []
+        self._asleep: List[bool] = []
+        # counter offset -> producers sleeping on it; may hold producers
+        # that have since woken up, which are skipped
+        self._sleepers: Dict[int, Set[int]] = {}
+
+    def reset(self):
+        """
+        Wake every producer.
+        """
+        self._active = list(range(len(self._steps)))
+        self._asleep = [False] * len(self._steps)
+        self._sleepers = {}
+
+    def __call__(self, world_grid):
+        if world_grid is not self._grid or world_grid.version != self._version:
+            with profiler.scope("tick.reachability"):
+                self._steps = build_steps(world_grid)
+            self._grid = world_grid
+            self._version = world_grid.version
+            self.reset()
+
+        stock, totals = world_grid.stock, world_grid.ledger.stock
+        steps, asleep, sleepers = self._steps, self._asleep, self._sleepers
+        queue = self._active  # sorted, so already a heap
+        later: List[int] = []
+        # while profiling, input checks and deposits are summed over the
+        # tick and recorded as two phases laid end to end
+        timed = profiler.enabled
+        clock = time.perf_counter
+        t0 = clock() if timed else 0.0
+        check_s = deposit_s = 0.0
+        while queue:
+            i = heapq.heappop(queue)
+            ins, outs, offs, watch = steps[i]
+            if timed:
+                a = clock()
+            for base in offs:
+                if all(stock[base + r] >= need for r, need in ins):
+                    break
+            else:
+                asleep[i] = True
+                for c in watch:
+                    sleepers.setdefault(c, set()).add(i)
+                if timed:
+                    check_s += clock() - a
+                continue
+
+            if timed:
+                b = clock()
+                check_s += b - a
+            for r, need in ins:
+                stock[base + r] -= need
+                totals[r] -= need
+            for r, amount in outs:
+                stock[base + r] += amount
+                totals[r] += amount
+                for j in sleepers.pop(base + r, ()):
+                    if not asleep[j]:
+                        continue
+                    asleep[j] = False
+                    if j > i:
+                        heapq.heappush(queue, j)
+                    else:
+                        later.append(j)
+            later.append(i)
+            if timed:
+                deposit_s += clock() - b
+        later.sort()
+        self._active = later
+        if timed:
+            profiler.record("tick.inputs", t0, check_s)
+            profiler.record("tick.deposit", t0 + check_s, deposit_s)
@@ -0,0 +1,258 @@
+"""
+Fixed-timestep simulation running off the render thread.
+
+The driver owns the live Grid and is the only thing that mutates it. The
+UI sends placement/upgrade commands through a queue and draws from
+immutable snapshots that the worker publishes: a new snapshot replaces
+the front one under a lock and readers keep whatever they already hold,
+so rendering never sees a half-applied tick.
+"""
+
+import queue
+import threading
+import time
+import traceback
+from array import array
+from typing import Callable, Dict, Iterable, Optional, Set, Tuple
+
+import config
+import profiler
+import throughput
+import world
+
+# Commands accepted by SimulationDriver.submit, by name. Buildings travel
+# as ids so commands stay plain data.
+COMMANDS: Dict[str, Callable] = {
+    "place_building": lambda g, x, y, bid: world.place_building(
+        g, x, y, world.BUILDINGS[bid]
+    ),
+    "place_terrain": world.place_terrain,
+    "upgrade_tile": world.upgrade_tile,
+    "erase_tile": world.erase_tile,
+    # area versions take a list of cells and apply them as one batch
+    "place_buildings": lambda g, cells, bid: world.place_buildings(
+        g, cells, world.BUILDING_TABLE[bid]
+    ),
+    "place_terrains": world.place_terrains,
+    "erase_tiles": world.erase_tiles,
+}
+
+
+class Snapshot(world.GridView):
+    """
+    Frozen copy of a Grid. Chunks are shared with `base` (the previous
+    snapshot) unless one of the `changed` cells falls inside them, so a
+    publish copies only the chunks that were edited.
+    """
+
+    def __init__(
+        self,
+        grid: world.Grid,
+        tick: int,
+        base: Optional["Snapshot"],
+        changed: Iterable[Tuple[int, int]] = (),
+    ):
+        self.width = grid.width
+        self.height = grid.height
+        size = world.CHUNK_SIZE
+        if base is None:
+            self.chunks = {key: c.copy() for key, c in grid.chunks.items()}
+            self.slots = dict(grid.slots)
+        else:
+            self.chunks = dict(base.chunks)
+            for key in {(x // size, y // size) for x, y in changed}:
+                chunk = grid.chunks.get(key)
+                if chunk is None:
+                    self.chunks.pop(key, None)
+                else:
+                    self.chunks[key] = chunk.copy()
+            self.slots = dict(grid.slots) if changed else base.slots
+        self.stock = array("q")
+        self.stock.frombytes(memoryview(grid.stock).cast("B"))
+        self.ledger = grid.ledger.copy()
+        self.tick = tick
+        # throughput.Throughput while the driver is asked for rates
+        self.rates: Optional[throughput.Throughput] = None
+
+
+class SimulationDriver:
+    """
+    Runs tick_fn on its own thread every config.TICK_INTERVAL / speed
+    seconds; speed 0 means as fast as possible.
+    """
+
+    def __init__(
+        self,
+        grid: world.Grid,
+        tick_fn: Callable = world.simulate_tick,
+        autosave=None,
+        ticks: int = 0,
+    ):
+        self.grid = grid
+        self.tick_fn = tick_fn
+        # savefile.Autosave journaling every command and tick, or None
+        self.autosave = autosave
+        # recording.Recorder while a session is being recorded
+        self.recorder = None
+        self.interval = config.TICK_INTERVAL
+        self.speed = 1
+        self.ticks = ticks
+        self.commands: "queue.Queue[Tuple[str, tuple]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._changed: Set[Tuple[int, int]] = set()
+        self._taken: Set[Tuple[int, int]] = set()
+        self._state_dirty = False
+        self._next_tick = 0.0
+        self._last_publish = 0.0
+        # steady-state rates are only solved while someone looks at them
+        self._solver: Optional[throughput.Solver] = None
+        # called on the worker thread after every publish, e.g. to wake a
+        # UI that sleeps while nothing changes
+        self.on_publish: Optional[Callable[[], None]] = None
+        grid.listeners.append(self._on_change)
+        self._front = Snapshot(grid, ticks, None)
+
+    # UI side
+    def start(self):
+        self._next_tick = time.perf_counter() + self.interval
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self.commands.put(("noop", ()))
+        if self._thread:
+            self._thread.join()
+        if self.autosave:
+            self.autosave.close(self.grid, self.ticks)
+        if self.recorder:
+            self.recorder.close()
+
+    def submit(self, name: str, *args):
+        self.commands.put((name, args))
+
+    def set_speed(self, speed: int):
+        self.commands.put(("set_speed", (speed,)))
+
+    def show_rates(self, show: bool):
+        """
+        Attach solved steady-state rates to every snapshot while `show`.
+        """
+        self.commands.put(("show_rates", (show,)))
+
+    def record(self, path: Optional[str]):
+        """
+        Start recording the session to `path`, or stop with None.
+        """
+        self.commands.put(("record", (path,)))
+
+    def note(self, name: str, *args):
+        """
+        Add a UI event that doesn't touch the world, such as a tool
+        switch, to the recording if one is running.
+        """
+        self.commands.put(("note", (name, args)))
+
+    def latest(self) -> Tuple[Snapshot, Set[Tuple[int, int]]]:
+        """
+        The newest snapshot plus the cells changed since the last call.
+        """
+        with self._lock:
+            changed, self._taken = self._taken, set()
+            return self._front, changed
+
+    # worker side
+    def _on_change(self, x: int, y: int):
+        self._changed.add((x, y))
+
+    def _apply(self, name: str, args: tuple):
+        if name == "set_speed":
+            self.speed = args[0]
+            self._next_tick = time.perf_counter() + self._period()
+        elif name == "record":
+            if self.recorder:
+                self.recorder.close()
+                self.recorder = None
+            if args[0]:
+                import recording
+
+                self.recorder = recording.Recorder(args[0], self.grid, self.ticks)
+        elif name == "note":
+            if self.recorder:
+                self.recorder.record(args[0], *args[1])
+        elif name == "show_rates":
+            self._solver = throughput.Solver() if args[0] else None
+            self._state_dirty = True
+        elif name in COMMANDS:
+            COMMANDS[name](self.grid, *args)
+            self._state_dirty = True
+            if self.autosave:
+                self.autosave.record(name, *args)
+            if self.recorder:
+                self.recorder.record(name, *args)
+
+    def _period(self) -> float:
+        return self.interval / self.speed if self.speed else 0.0
+
+    def _publish(self):
+        t0 = profiler.start()
+        snap = Snapshot(self.grid, self.ticks, self._front, self._changed)
+        if self._solver:
+            # re-solves only after edits, and then only the touched shards
+            snap.rates = self._solver.solve(self.grid, self._changed)
+        profiler.stop("publish", t0)
+        with self._lock:
+            self._front = snap
+            self._taken |= self._changed
+        self._changed = set()
+        self._state_dirty = False
+        self._last_publish = time.perf_counter()
+        if self.on_publish:
+            self.on_publish()
+
+    def _run(self):
+        publish_period = 1 / config.SNAPSHOT_HZ
+        while not self._stop.is_set():
+            now = time.perf_counter()
+            if self.speed == 0 or now >= self._next_tick:
+                with profiler.scope("tick"):
+                    self.tick_fn(self.grid)
+                self.ticks += 1
+                self._state_dirty = True
+                if self.autosave:
+                    self.autosave.record("tick")
+                if self.recorder:
+                    self.recorder.record("tick")
+                if self.speed:
+                    self._next_tick += self._period()
+                    # after a stall, resume the fixed rate instead of
+                    # replaying every missed tick back to back
+                    if now - self._next_tick > self.interval:
+                        self._next_tick = now + self._period()
+
+            if self.autosave:
+                self.autosave.poll(self.grid, self.ticks)
+
+            now = time.perf_counter()
+            publish_at = self._last_publish + publish_period
+            if self._state_dirty and now >= publish_at:
+                self._publish()
+
+            timeout = 0.0 if self.speed == 0 else self._next_tick - now
+            if self._state_dirty:
+                timeout = min(timeout, publish_at - now)
+            try:
+                name, args = self.commands.get(timeout=max(timeout, 0.0))
+                while True:
+                    try:
+                        self._apply(name, args)
+                    except Exception:
+                        # report and skip a bad command; letting it end this
+                        # thread would stop the world for every client
+                        traceback.print_exc()
+                        self._state_dirty = True
+                    name, args = self.commands.get_nowait()
+            except queue.Empty:
+                pass
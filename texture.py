@@ -1,9 +1,140 @@
+"""
+Sprite atlases for the map tiles and the tool palette.
+
+Every terrain/building combination is rasterised once per tile size into
+a single surface, and every tool icon once per icon size, so drawing a
+tile or a palette entry is one blit of a subsurface instead of a run of
+pygame.draw calls.
+
+A PNG in config.TEXTURE_DIR named after a terrain key (forest.png) or a
+building's name (banana_grove.png) replaces the drawn top face or icon,
+scaled to fit (terrain clipped to the diamond); transparent pixels let
+the drawn version show through. Files are loaded and converted for fast
+blits once.
+"""
+
+import os
+from typing import Callable, Dict, List, Optional
+
 import pygame
 
+import config
+import world
+
+_images: Dict[str, Optional[pygame.Surface]] = {}
+
+
+def texture_name(b: world.Building) -> str:
+    return b.name.lower().replace(" ", "_")
+
+
+def image(name: str) -> Optional[pygame.Surface]:
+    """
+    The texture file for `name`, or None if there is none. convert_alpha
+    needs a display mode, so nothing is loaded (or remembered) before one
+    is set.
+    """
+    if name in _images:
+        return _images[name]
+    if pygame.display.get_surface() is None:
+        return None
+    path = os.path.join(config.TEXTURE_DIR, name + ".png")
+    surf = pygame.image.load(path).convert_alpha() if os.path.exists(path) else None
+    _images[name] = surf
+    return surf
+
+
+def blit_scaled(surface, img, rect):
+    surface.blit(pygame.transform.smoothscale(img, rect.size), rect)
+
+
+def blit_diamond(surface, img, rect):
+    """
+    img scaled to rect and clipped to the diamond inscribed in it.
+    """
+    scaled = pygame.transform.smoothscale(img, rect.size)
+    w, h = rect.size
+    mask = pygame.Surface(rect.size, pygame.SRCALPHA)
+    pts = [(w // 2, 0), (w, h // 2), (w // 2, h), (0, h // 2)]
+    pygame.draw.polygon(mask, (255, 255, 255, 255), pts)
+    scaled.blit(mask, (0, 0), special_flags=pygame.BLEND_RGBA_MULT)
+    surface.blit(scaled, rect)
+
+
+def draw_building_icon(surface, bid: int, cx: int, cy: int, sz: int):
+    """
+    Building `bid`'s icon centred on (cx, cy), about 2 * sz across.
+    """
+    bld = world.BUILDING_TABLE[bid]
+    if not bld:
+        return
+    img = image(texture_name(bld))
+    if img is not None:
+        blit_scaled(surface, img, pygame.Rect(cx - sz, cy - sz, 2 * sz, 2 * sz))
+    elif bld.shape == "square":
+        h = sz // 2
+        pygame.draw.rect(surface, bld.color, (cx - h, cy - h, 2 * h, 2 * h))
+    elif bld.shape == "circle":
+        pygame.draw.circle(surface, bld.color, (cx, cy), sz // 2)
+    elif bld.shape == "triangle":
+        pts = [(cx, cy - sz), (cx - sz, cy + sz), (cx + sz, cy + sz)]
+        pygame.draw.polygon(surface, bld.color, pts)
+
+
+def draw_terrain_icon(surface, code: int, x0: int, y0: int, size: int):
+    """
+    Flat diamond of the terrain with this code in the size x size box at
+    (x0, y0).
+    """
+    img = image(world.TERRAINS_LIST[code].key)
+    if img is not None:
+        blit_diamond(surface, img, pygame.Rect(x0, y0, size, size))
+        return
+    pts = [
+        (x0 + size // 2, y0),
+        (x0 + size, y0 + size // 2),
+        (x0 + size // 2, y0 + size),
+        (x0, y0 + size // 2),
+    ]
+    pygame.draw.polygon(surface, world.TERRAIN_COLORS[code], pts)
+
+
+class Atlas:
+    """
+    Every terrain/building tile at one tile size, painted by
+    `paint(surface, x, y, terrain_code, bid, tw, th, ox, oy)` into cells
+    of one surface. tiles[terrain_code][bid] is the tile's subsurface.
+    """
+
+    def __init__(self, tw: int, th: int, paint: Callable):
+        self.size = (tw, th)
+        cw, ch = tw + 1, th + th // 2 + 1
+        cols, rows = len(world.BUILDING_TABLE), len(world.TERRAINS_LIST)
+        self.surface = pygame.Surface((cols * cw, rows * ch), pygame.SRCALPHA)
+        self.tiles: List[List[pygame.Surface]] = []
+        for code in range(rows):
+            row = []
+            for bid in range(cols):
+                sub = self.surface.subsurface((bid * cw, code * ch, cw, ch))
+                paint(sub, 0, 0, code, bid, tw, th, 0, 0)
+                row.append(sub)
+            self.tiles.append(row)
 
-def create_ground_texture(tile_w, tile_h):
+
+class IconSheet:
     """
-    Stub for compatibility: Polytopia‑style is flat, so we return
-    a fully transparent surface (no texture).
+    The tool palette's icons, one per entry of world.TOOLS.
     """
-    return pygame.Surface((tile_w, tile_h), pygame.SRCALPHA)
+
+    def __init__(self, size: int):
+        self.size = size
+        tools = world.TOOLS
+        self.surface = pygame.Surface((len(tools) * size, size), pygame.SRCALPHA)
+        self.icons: List[pygame.Surface] = []
+        for i, (kind, key) in enumerate(tools):
+            sub = self.surface.subsurface((i * size, 0, size, size))
+            if kind == "terrain":
+                draw_terrain_icon(sub, world.TERRAIN_CODES[key], 0, 0, size)
+            else:
+                draw_building_icon(sub, key, size // 2, size // 2, size // 2 - 4)
+            self.icons.append(sub)
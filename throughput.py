@@ -0,0 +1,395 @@
+"""
+Steady-state production rates, solved from the production graph instead
+of watched over many ticks.
+
+Every producer is linked to the chests it can reach. Stock is treated
+as a flow: a chest offers each resource at the rate producers deposit it,
+and a consumer draws from its chests in the order the tick tries them;
+see _pass for who gets the stock when producers compete for it. Recipes
+form an acyclic graph, so a few passes settle every rate. Finite stock
+already in the chests is ignored, since it only delays the steady state.
+
+Rates are exact for chests nobody competes over. Where several consumers
+share a starved chest, who wins a leftover batch depends on the stock's
+history, and the solved rates can be off by a fire or so per tick.
+
+Producers that share no chest can't affect each other, so results are
+kept per group of chest-sharing producers (a shard, as in parallel.py).
+Links and shards persist between solves: an edit only re-links the
+producers whose reach it could change and re-solves their shards.
+"""
+
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import world
+
+EPSILON = 1e-9
+
+
+def _recipe_depth() -> Dict[int, int]:
+    # a building's depth is one more than the deepest maker of its inputs
+    makers = defaultdict(list)
+    for b in world.BUILDINGS_LIST:
+        for res in b.outputs:
+            makers[res].append(b)
+    depth: Dict[int, int] = {}
+
+    def visit(b) -> int:
+        if b.id not in depth:
+            depth[b.id] = 0  # guards against recipe cycles
+            depth[b.id] = 1 + max(
+                (visit(m) for res in b.inputs for m in makers[res]), default=-1
+            )
+        return depth[b.id]
+
+    for b in world.BUILDINGS_LIST:
+        visit(b)
+    return depth
+
+
+# passes needed for supplies to reach the deepest recipe, plus one to
+# confirm nothing moved
+MAX_PASSES = max(_recipe_depth().values()) + 2
+
+# (x, y, building id, level, chest offsets)
+Link = Tuple[int, int, int, int, List[int]]
+
+
+@dataclass
+class ProducerRate:
+    x: int
+    y: int
+    bid: int
+    lvl: int
+    rate: float  # fires per tick, 0..1
+    # None when running flat out, "no chest" when nothing is reachable,
+    # otherwise the input resource that runs out first
+    limit: Optional[str]
+
+    @property
+    def name(self) -> str:
+        return world.BUILDING_TABLE[self.bid].name
+
+
+class ShardRates:
+    """
+    Solved rates for one shard plus its contribution to the totals.
+    """
+
+    def __init__(self, links: List[Link], rates: List[float], limits: list):
+        self.rates = rates
+        self.limits = limits
+        self.net = [0.0] * world.NUM_RESOURCES
+        # per resource: (building id, level) -> [count, amount]
+        self.sources: List[Dict[Tuple[int, int], List[float]]] = [
+            {} for _ in range(world.NUM_RESOURCES)
+        ]
+        for (_, _, bid, lvl, _), rate in zip(links, rates):
+            scale = 2 ** (lvl - 1)
+            for r, amt in world.OUTPUTS[bid]:
+                self._add(r, bid, lvl, rate * amt * scale)
+            for r, req in world.INPUTS[bid]:
+                self._add(r, bid, lvl, -rate * req * lvl)
+
+    def _add(self, r: int, bid: int, lvl: int, amount: float):
+        self.net[r] += amount
+        entry = self.sources[r].setdefault((bid, lvl), [0, 0.0])
+        entry[0] += 1
+        entry[1] += amount
+
+
+class Sums:
+    """
+    Running totals over a changing set of shards.
+    """
+
+    def __init__(self):
+        self.net = [0.0] * world.NUM_RESOURCES
+        # per resource: (building id, level) -> [count, amount]
+        self.sources: List[Dict[Tuple[int, int], List[float]]] = [
+            {} for _ in range(world.NUM_RESOURCES)
+        ]
+
+    def add(self, solved: ShardRates, sign: int):
+        """
+        Add the shard's rates, or take them away again with sign -1.
+        """
+        for r in range(world.NUM_RESOURCES):
+            self.net[r] = _settle(self.net[r] + sign * solved.net[r])
+            per_res = self.sources[r]
+            for key, (count, amount) in solved.sources[r].items():
+                entry = per_res.setdefault(key, [0, 0.0])
+                entry[0] += sign * count
+                entry[1] = _settle(entry[1] + sign * amount)
+                if not entry[0]:
+                    del per_res[key]
+
+
+def _settle(amount: float) -> float:
+    # taking shards away again leaves rounding dust where a sum is zero
+    return 0.0 if abs(amount) < EPSILON else amount
+
+
+class Throughput:
+    """
+    Solved rates for a whole grid. Per-resource lists are ordered like
+    world.RESOURCE_KEYS; totals() and breakdown() mirror world.Ledger.
+    """
+
+    def __init__(self, shards: List[Tuple[List[Link], ShardRates]], sums=None):
+        self.shards = shards
+        if sums is None:
+            sums = Sums()
+            for _, solved in shards:
+                sums.add(solved, 1)
+        self.net = list(sums.net)
+        self.sources = [
+            {key: list(entry) for key, entry in per_res.items()}
+            for per_res in sums.sources
+        ]
+        self._bottlenecks: Optional[List[ProducerRate]] = None
+
+    def totals(self) -> Dict[str, float]:
+        return dict(zip(world.RESOURCE_KEYS, self.net))
+
+    def breakdown(self, res_key: str) -> List[Tuple[str, int, int, float]]:
+        """
+        (building name, level, count, amount) rows, producers first.
+        """
+        rows = [
+            (world.BUILDING_TABLE[bid].name, lvl, count, amount)
+            for (bid, lvl), (count, amount) in self.sources[
+                world.RESOURCE_INDEX[res_key]
+            ].items()
+        ]
+        rows.sort(key=lambda row: (-row[3], row[0], row[1]))
+        return rows
+
+    def producers(self) -> List[ProducerRate]:
+        return [
+            ProducerRate(x, y, bid, lvl, rate, limit)
+            for links, solved in self.shards
+            for (x, y, bid, lvl, _), rate, limit in zip(
+                links, solved.rates, solved.limits
+            )
+        ]
+
+    def bottlenecks(self) -> List[ProducerRate]:
+        """
+        Producers running below full rate, slowest first. Worked out on
+        the first call; a Throughput never changes.
+        """
+        if self._bottlenecks is None:
+            slow = [p for p in self.producers() if p.limit is not None]
+            slow.sort(key=lambda p: (p.rate, p.y, p.x))
+            self._bottlenecks = slow
+        return self._bottlenecks
+
+
+def _link(world_grid, x: int, y: int, bid: int, lvl: int) -> Link:
+    """
+    The producer at (x, y) with the chests it can reach, in tick order.
+    """
+    offs = world.chest_offsets(world_grid, x, y)
+    return (x, y, bid, lvl, world.used_chests(bid, offs))
+
+
+def _pass(links: List[Link], deposits: List[list]):
+    """
+    Share out one tick's worth of supply. deposits[i] lists the
+    (chest offset, resource, amount) producer i put in per tick as of the
+    last pass; returns the rates, the limiting input per producer and the
+    new deposits.
+
+    Stock is spent a whole batch at a time by the first producer in tick
+    order that can afford it: after a deposit, the producers behind it in
+    the same tick get the first try, and then the ones in front of it on
+    the next tick. That is why a Rope Twister right after a Banana Grove
+    starves a Sticky Press further on. Whatever is too little for a whole
+    batch piles up over several ticks and is finally shared out as
+    fractional rates.
+    """
+    n = len(links)
+    stock: Dict[Tuple[int, int], float] = {}
+    left = [1.0] * n
+    short: List[Optional[int]] = [None] * n
+    out: List[list] = [[] for _ in range(n)]
+
+    def affordable(i: int, off: int) -> float:
+        # how many fires this chest can pay for, up to one
+        lvl = links[i][3]
+        ratio = 1.0
+        for r, req in world.INPUTS[links[i][2]]:
+            avail = stock.get((off, r), 0.0) / (req * lvl)
+            if avail < ratio:
+                ratio = avail
+                short[i] = r
+        return ratio
+
+    def fire(i: int, off: int, take: float):
+        bid, lvl = links[i][2], links[i][3]
+        for r, req in world.INPUTS[bid]:
+            stock[(off, r)] -= take * req * lvl
+        scale = take * 2 ** (lvl - 1)
+        for r, amt in world.OUTPUTS[bid]:
+            out[i].append((off, r, scale * amt))
+        left[i] -= take
+
+    # whole batches: this tick behind each deposit, then the next tick
+    for lap in (0, 1):
+        for i in range(n):
+            if left[i]:
+                for off in links[i][4]:
+                    if affordable(i, off) >= 1.0 - EPSILON:
+                        fire(i, off, 1.0)
+                        left[i] = 0.0
+                        break
+            if lap == 0:
+                for off, r, amount in deposits[i]:
+                    stock[(off, r)] = stock.get((off, r), 0.0) + amount
+
+    # leftovers too small for a batch
+    for i in range(n):
+        for off in links[i][4]:
+            if left[i] <= EPSILON:
+                break
+            take = min(left[i], affordable(i, off))
+            if take > EPSILON:
+                fire(i, off, take)
+
+    rates, limits = [], []
+    for (_, _, _, _, offs), rest, r in zip(links, left, short):
+        rest = 0.0 if rest <= EPSILON else rest
+        rates.append(1.0 - rest if offs else 0.0)
+        if not offs:
+            limits.append("no chest")
+        elif rest and r is not None:
+            limits.append(world.RESOURCE_KEYS[r])
+        else:
+            limits.append(None)
+    return rates, limits, out
+
+
+def solve_shard(links: List[Link]) -> ShardRates:
+    deposits: List[list] = [[] for _ in links]
+    rates, limits = [], []
+    for _ in range(MAX_PASSES):
+        rates, limits, out = _pass(links, deposits)
+        if out == deposits:
+            break
+        deposits = out
+    return ShardRates(links, rates, limits)
+
+
+# shard key of producers that reach no chest; they form one shard
+NO_CHEST = -1
+
+
+class Solver:
+    """
+    Keeps every producer's links and shard between solves. After edits
+    only the producers on or near the changed cells are linked again, and
+    only the shards they were in, or now share a chest with, are regrouped
+    and solved again.
+    """
+
+    def __init__(self):
+        self._grid = None
+        self._version = None
+        self.result: Optional[Throughput] = None
+        self._reset()
+
+    def _reset(self):
+        self._links: Dict[Tuple[int, int], Link] = {}
+        self._shard_of: Dict[Tuple[int, int], int] = {}
+        # shard id -> (links in tick order, solved rates)
+        self._shards: Dict[int, Tuple[List[Link], ShardRates]] = {}
+        # chest offset (or NO_CHEST) -> id of the shard whose producers use it
+        self._owner: Dict[int, int] = {}
+        self._next_id = 0
+        self._sums = Sums()
+
+    def solve(self, world_grid, changed=None) -> Throughput:
+        """
+        Rates for world_grid. `changed` holds the cells edited since the
+        last call; without it, for another grid or after the grid was
+        reindexed, every producer is linked again.
+        """
+        if world_grid is self._grid and world_grid.version == self._version:
+            return self.result
+        if world_grid is not self._grid or changed is None or world_grid.network.stale:
+            self._reset()
+            touched = {
+                (x, y)
+                for x, y, bid, _ in world_grid.occupied()
+                if world.ROLES[bid] & world.ROLE_PRODUCER
+            }
+        else:
+            changed = set(changed)
+            touched = world_grid.network.producers_near(changed)
+            touched |= changed & self._links.keys()
+        self._grid = world_grid
+        self._version = world_grid.version
+
+        # re-link the touched producers; their old shards break up
+        regroup = set()
+        for p in touched:
+            if self._links.pop(p, None) is not None:
+                regroup.add(self._shard_of.pop(p))
+            bid = world_grid.building_id(*p)
+            if world.ROLES[bid] & world.ROLE_PRODUCER:
+                self._links[p] = _link(world_grid, *p, bid, world_grid.level(*p))
+        # so do the shards owning a chest one of the new links reaches
+        for p in touched:
+            if p in self._links:
+                for off in self._links[p][4] or [NO_CHEST]:
+                    if off in self._owner:
+                        regroup.add(self._owner[off])
+        members = set(touched & self._links.keys())
+        reused: Dict[tuple, ShardRates] = {}
+        for sid in regroup:
+            links, solved = self._shards.pop(sid)
+            self._sums.add(solved, -1)
+            reused[_shard_key(links)] = solved
+            for link in links:
+                for off in link[4] or [NO_CHEST]:
+                    self._owner.pop(off, None)
+                if (link[0], link[1]) in self._links:
+                    members.add((link[0], link[1]))
+
+        for group in _group([self._links[p] for p in members]):
+            key = _shard_key(group)
+            solved = reused.get(key) or solve_shard(group)
+            reused[key] = solved
+            sid = self._next_id
+            self._next_id += 1
+            self._shards[sid] = (group, solved)
+            self._sums.add(solved, 1)
+            for link in group:
+                self._shard_of[(link[0], link[1])] = sid
+                for off in link[4] or [NO_CHEST]:
+                    self._owner[off] = sid
+
+        # first producer in tick order decides a shard's place
+        shards = sorted(self._shards.values(), key=lambda s: (s[0][0][1], s[0][0][0]))
+        self.result = Throughput(shards, self._sums)
+        return self.result
+
+
+def _shard_key(links: List[Link]) -> tuple:
+    return tuple((bid, lvl, tuple(offs)) for _, _, bid, lvl, offs in links)
+
+
+def _group(links: List[Link]) -> List[List[Link]]:
+    """
+    Split links into groups that share no chest, each in tick order.
+    Producers with no chest at all form one group of their own.
+    """
+    links = sorted(links, key=lambda link: (link[1], link[0]))
+    return world.split_shards(links, lambda link: link[4])
+
+
+def solve(world_grid) -> Throughput:
+    return Solver().solve(world_grid)
@@ -1,7 +1,13 @@
 from dataclasses import dataclass, field
-from collections import defaultdict
-from typing import Dict, List, Tuple
+from array import array
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 import config
+import profiler
+import resources
+from network import BELT_ID, CHEST_ID, NetworkIndex, Pos
 
 
 @dataclass
@@ -102,102 +108,703 @@ def get_selected_tool() -> Tuple[str, object]:
     return TOOLS[_selected_tool]
 
 
+# Dense indexes used by the array-backed grid
+TERRAIN_CODES: Dict[str, int] = {t.key: i for i, t in enumerate(TERRAINS_LIST)}
+RESOURCE_KEYS: List[str] = list(resources.RESOURCES)
+RESOURCE_INDEX: Dict[str, int] = {k: i for i, k in enumerate(RESOURCE_KEYS)}
+NUM_RESOURCES = len(RESOURCE_KEYS)
+
+# Capability tables compiled from BUILDINGS_LIST and TERRAINS_LIST. Hot
+# paths index these by building id or terrain code instead of comparing
+# names or walking dicts; id 0 is the empty cell.
+ROLE_CHEST = 1
+ROLE_BELT = 2
+ROLE_PRODUCER = 4  # has outputs
+ROLE_CONSUMER = 8  # has inputs
+ROLE_UPGRADABLE = 16  # its level scales what it makes
+
+BUILDING_TABLE: List[Optional[Building]] = [None] * (max(BUILDINGS) + 1)
+ROLES: List[int] = [0] * len(BUILDING_TABLE)
+# amount of each resource per fire at level 1, indexed by resource index
+INPUT_VECTORS: List[Tuple[int, ...]] = [(0,) * NUM_RESOURCES] * len(BUILDING_TABLE)
+OUTPUT_VECTORS: List[Tuple[int, ...]] = list(INPUT_VECTORS)
+# the non-zero entries of those vectors as (resource index, amount)
+INPUTS: List[Tuple[Tuple[int, int], ...]] = [()] * len(BUILDING_TABLE)
+OUTPUTS: List[Tuple[Tuple[int, int], ...]] = [()] * len(BUILDING_TABLE)
+# bit TERRAIN_CODES[key] is set for every terrain the building may stand on
+TERRAIN_MASKS: List[int] = [0] * len(BUILDING_TABLE)
+TERRAIN_COLORS: List[Tuple[int, int, int]] = [t.color for t in TERRAINS_LIST]
+
+for _b in BUILDINGS_LIST:
+    BUILDING_TABLE[_b.id] = _b
+    ROLES[_b.id] = (
+        (ROLE_CHEST if _b.id == CHEST_ID else 0)
+        | (ROLE_BELT if _b.id == BELT_ID else 0)
+        | (ROLE_PRODUCER if _b.outputs else 0)
+        | (ROLE_CONSUMER if _b.inputs else 0)
+        | (ROLE_UPGRADABLE if _b.id not in (CHEST_ID, BELT_ID) else 0)
+    )
+    INPUTS[_b.id] = tuple((RESOURCE_INDEX[k], n) for k, n in _b.inputs.items())
+    OUTPUTS[_b.id] = tuple((RESOURCE_INDEX[k], n) for k, n in _b.outputs.items())
+    for _table, _pairs in ((INPUT_VECTORS, INPUTS), (OUTPUT_VECTORS, OUTPUTS)):
+        _vector = [0] * NUM_RESOURCES
+        for _r, _n in _pairs[_b.id]:
+            _vector[_r] = _n
+        _table[_b.id] = tuple(_vector)
+    for _t in _b.allowed_terrains:
+        TERRAIN_MASKS[_b.id] |= 1 << TERRAIN_CODES[_t]
+
+
+def allows(bid: int, terrain_code: int) -> bool:
+    """
+    Whether building `bid` may stand on the terrain with this code.
+    """
+    return bool(TERRAIN_MASKS[bid] >> terrain_code & 1)
+
+
+class Ledger:
+    """
+    Running economy totals, kept current by the Grid setters and the tick
+    engines so the UI never has to scan the map:
+      - net: nominal per-tick output minus input for each resource, at the
+        current building levels (what the Stats page shows)
+      - sources: per resource, (building name, level) -> [count, amount]
+      - stock: total of every Chimp Chest's inventory per resource
+    All per-resource lists are ordered like RESOURCE_KEYS.
+    """
+
+    def __init__(self):
+        self.net = [0] * NUM_RESOURCES
+        self.sources: List[Dict[Tuple[str, int], List[int]]] = [
+            {} for _ in range(NUM_RESOURCES)
+        ]
+        self.stock = [0] * NUM_RESOURCES
+        # (building id, level) -> count while held; see Grid.batch
+        self.pending: Optional[Counter] = None
+
+    def hold(self):
+        """
+        Tally building changes instead of applying them one by one.
+        """
+        if self.pending is None:
+            self.pending = Counter()
+
+    def release(self):
+        pending, self.pending = self.pending, None
+        for (bid, lvl), count in (pending or {}).items():
+            if count:
+                self.add_building(bid, lvl, count)
+
+    def add_building(self, bid: int, lvl: int, count: int = 1):
+        if self.pending is not None:
+            self.pending[(bid, lvl)] += count
+            return
+        b = BUILDING_TABLE[bid]
+        if not b:
+            return
+        scale = 2 ** (lvl - 1)
+        for r, amt in OUTPUTS[bid]:
+            self._add_source(r, b.name, lvl, count, amt * scale)
+        for r, amt in INPUTS[bid]:
+            self._add_source(r, b.name, lvl, count, -amt * scale)
+
+    def remove_building(self, bid: int, lvl: int):
+        self.add_building(bid, lvl, -1)
+
+    def _add_source(self, r: int, name: str, lvl: int, count: int, amount: int):
+        self.net[r] += count * amount
+        entry = self.sources[r].setdefault((name, lvl), [0, 0])
+        entry[0] += count
+        entry[1] += count * amount
+        if not entry[0]:
+            del self.sources[r][(name, lvl)]
+
+    def totals(self) -> Dict[str, int]:
+        return dict(zip(RESOURCE_KEYS, self.net))
+
+    def breakdown(self, res_key: str) -> List[Tuple[str, int, int, int]]:
+        """
+        (building name, level, count, amount) rows, producers first.
+        """
+        rows = [
+            (name, lvl, count, amount)
+            for (name, lvl), (count, amount) in self.sources[
+                RESOURCE_INDEX[res_key]
+            ].items()
+        ]
+        rows.sort(key=lambda row: (-row[3], row[0], row[1]))
+        return rows
+
+    def stock_totals(self) -> Dict[str, int]:
+        return dict(zip(RESOURCE_KEYS, self.stock))
+
+    def copy(self) -> "Ledger":
+        other = Ledger()
+        other.net = list(self.net)
+        other.sources = [
+            {key: list(entry) for key, entry in src.items()} for src in self.sources
+        ]
+        other.stock = list(self.stock)
+        return other
+
+
 # World Grid management
-def init_world(width: int, height: int):
+CHUNK_SIZE = config.CHUNK_SIZE
+
+
+class Chunk:
     """
-    Create a height X width grid of cells. Each cell is a dict:
-      - 'building': None or a Building
-      - 'terrain': starts as 'base'
-      - 'inventory': defaultdict(int)
-      - 'level': int
+    A CHUNK_SIZE x CHUNK_SIZE block of cells. Cell (x, y) of the chunk
+    lives at index y * CHUNK_SIZE + x of flat typed arrays holding terrain
+    codes, building ids (0 = empty) and levels.
     """
-    default = TERRAINS_LIST[0].key  # "base"
-    return [
-        [
-            {
-                "building": None,
-                "terrain": default,
-                "inventory": defaultdict(int),
-                "level": 1,
-            }
-            for _ in range(width)
+
+    __slots__ = ("terrains", "buildings", "levels", "used", "built", "index")
+
+    def __init__(self):
+        n = CHUNK_SIZE * CHUNK_SIZE
+        self.terrains = array("B", bytes(n))
+        self.buildings = array("H", [0]) * n
+        self.levels = array("I", [1]) * n
+        # cells holding a building or non-base terrain, and buildings only
+        self.used = 0
+        self.built = 0
+        # indexes of occupied cells, rebuilt lazily after a building change
+        self.index: Optional[List[int]] = None
+
+    def copy(self) -> "Chunk":
+        other = Chunk.__new__(Chunk)
+        other.terrains = array("B", self.terrains)
+        other.buildings = array("H", self.buildings)
+        other.levels = array("I", self.levels)
+        other.used = self.used
+        other.built = self.built
+        other.index = self.index
+        return other
+
+    def occupied_cells(self) -> List[int]:
+        if self.index is None:
+            self.index = [i for i, bid in enumerate(self.buildings) if bid]
+        return self.index
+
+    def recount(self):
+        self.built = len(self.buildings) - self.buildings.count(0)
+        self.used = sum(1 for t, b in zip(self.terrains, self.buildings) if t or b)
+
+
+class GridView:
+    """
+    Read accessors shared by the live Grid and the immutable snapshots
+    published for rendering. Cells are stored in chunks keyed by
+    (x // CHUNK_SIZE, y // CHUNK_SIZE); a chunk only exists once something
+    was built or painted in it, and every cell outside one is empty base
+    terrain at level 1. Only Chimp Chests own inventory: each gets a slot,
+    a row of NUM_RESOURCES counters in `stock`, ordered like
+    resources.RESOURCES. `stock` is an array("q") or, while a
+    parallel.ParallelTicker runs the grid, a memoryview of the same layout.
+    """
+
+    width: int
+    height: int
+    chunks: Dict[Tuple[int, int], Chunk]
+    stock: array
+    slots: Dict[Tuple[int, int], int]
+    ledger: "Ledger"
+
+    def in_bounds(self, x: int, y: int) -> bool:
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    # accessors
+    def terrain(self, x: int, y: int) -> str:
+        chunk = self.chunks.get((x // CHUNK_SIZE, y // CHUNK_SIZE))
+        if chunk is None:
+            return TERRAINS_LIST[0].key
+        return TERRAINS_LIST[
+            chunk.terrains[y % CHUNK_SIZE * CHUNK_SIZE + x % CHUNK_SIZE]
+        ].key
+
+    def terrain_code(self, x: int, y: int) -> int:
+        chunk = self.chunks.get((x // CHUNK_SIZE, y // CHUNK_SIZE))
+        if chunk is None:
+            return 0
+        return chunk.terrains[y % CHUNK_SIZE * CHUNK_SIZE + x % CHUNK_SIZE]
+
+    def building_id(self, x: int, y: int) -> int:
+        chunk = self.chunks.get((x // CHUNK_SIZE, y // CHUNK_SIZE))
+        if chunk is None:
+            return 0
+        return chunk.buildings[y % CHUNK_SIZE * CHUNK_SIZE + x % CHUNK_SIZE]
+
+    def building(self, x: int, y: int):
+        return BUILDING_TABLE[self.building_id(x, y)]
+
+    def is_producer(self, x: int, y: int) -> bool:
+        return bool(ROLES[self.building_id(x, y)] & ROLE_PRODUCER)
+
+    def level(self, x: int, y: int) -> int:
+        chunk = self.chunks.get((x // CHUNK_SIZE, y // CHUNK_SIZE))
+        if chunk is None:
+            return 1
+        return chunk.levels[y % CHUNK_SIZE * CHUNK_SIZE + x % CHUNK_SIZE]
+
+    def occupied(self):
+        """
+        Yield (x, y, building id, level) for every building in row-major
+        order, the order ticks run producers in. Only chunks with
+        buildings are visited, and only their occupied cells.
+        """
+        rows: Dict[int, List[Tuple[int, Chunk]]] = {}
+        for (cx, cy), chunk in self.chunks.items():
+            if chunk.built:
+                rows.setdefault(cy, []).append((cx, chunk))
+        for cy in sorted(rows):
+            cells = []
+            for cx, chunk in rows[cy]:
+                x0, y0 = cx * CHUNK_SIZE, cy * CHUNK_SIZE
+                buildings, levels = chunk.buildings, chunk.levels
+                cells.extend(
+                    (y0 + i // CHUNK_SIZE, x0 + i % CHUNK_SIZE, buildings[i], levels[i])
+                    for i in chunk.occupied_cells()
+                )
+            cells.sort()
+            for y, x, bid, lvl in cells:
+                yield x, y, bid, lvl
+
+    def chest_slot(self, x: int, y: int) -> int:
+        """
+        Offset of the chest's first counter in `stock`, or -1.
+        """
+        slot = self.slots.get((x, y))
+        return -1 if slot is None else slot * NUM_RESOURCES
+
+    def inventory(self, x: int, y: int) -> Dict[str, int]:
+        base = self.chest_slot(x, y)
+        if base < 0:
+            return {}
+        return {
+            k: self.stock[base + i]
+            for i, k in enumerate(RESOURCE_KEYS)
+            if self.stock[base + i]
+        }
+
+    def chests(self):
+        """
+        Yield (x, y, offset) for every Chimp Chest.
+        """
+        for (x, y), slot in self.slots.items():
+            yield x, y, slot * NUM_RESOURCES
+
+    def chest_totals(self) -> Dict[str, int]:
+        """
+        Recount every chest; the ledger keeps the same numbers up to date.
+        """
+        totals = [0] * NUM_RESOURCES
+        stock = self.stock
+        for slot in self.slots.values():
+            base = slot * NUM_RESOURCES
+            for r in range(NUM_RESOURCES):
+                totals[r] += stock[base + r]
+        return dict(zip(RESOURCE_KEYS, totals))
+
+
+class Grid(GridView):
+    """
+    The live, mutable world grid. Nothing is allocated up front: memory
+    follows what's built, and writing past the edge grows the bounds.
+    """
+
+    def __init__(self, width: int, height: int):
+        self.width = width
+        self.height = height
+        self.chunks = {}
+        self.stock = array("q")
+        self.slots = {}
+        self._free_slots: List[int] = []
+        self.ledger = Ledger()
+        # bumped whenever buildings or levels change
+        self.version = 0
+        # called as listener(x, y) after any cell changes
+        self.listeners: List[Callable[[int, int], None]] = []
+        self.network = NetworkIndex(self)
+        self._batch_depth = 0
+
+    def _cell(self, x: int, y: int, create: bool):
+        """
+        (chunk key, chunk or None, index) for a cell about to be written.
+        A write that creates something grows the bounds to cover the cell.
+        """
+        if x < 0 or y < 0:
+            raise IndexError(f"cell ({x}, {y}) is outside the world")
+        key = (x // CHUNK_SIZE, y // CHUNK_SIZE)
+        chunk = self.chunks.get(key)
+        if create:
+            if chunk is None:
+                chunk = self.chunks[key] = Chunk()
+            self.width = max(self.width, x + 1)
+            self.height = max(self.height, y + 1)
+        return key, chunk, y % CHUNK_SIZE * CHUNK_SIZE + x % CHUNK_SIZE
+
+    def _settle(self, key, chunk: Chunk, i: int, was_used: bool):
+        # keep the chunk's used count current and free it once it's blank
+        chunk.used += bool(chunk.terrains[i] or chunk.buildings[i]) - was_used
+        if not chunk.used:
+            del self.chunks[key]
+
+    @contextmanager
+    def batch(self):
+        """
+        Apply many edits as one: network and ledger upkeep is collected
+        and done once when the outermost batch ends. Listeners still hear
+        about every cell.
+        """
+        if not self._batch_depth:
+            self.ledger.hold()
+            self.network.hold()
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth:
+                self.ledger.release()
+                self.network.release()
+
+    # raw setters; use the module-level mutators so the indexes stay in sync
+    def set_terrain(self, x: int, y: int, terrain_key: str):
+        code = TERRAIN_CODES[terrain_key]
+        key, chunk, i = self._cell(x, y, code != 0)
+        if chunk is not None:
+            was_used = bool(chunk.terrains[i] or chunk.buildings[i])
+            chunk.terrains[i] = code
+            self._settle(key, chunk, i, was_used)
+        self._changed(x, y)
+
+    def set_building(self, x: int, y: int, b):
+        bid = b.id if b else 0
+        key, chunk, i = self._cell(x, y, bid != 0)
+        if chunk is not None:
+            old = chunk.buildings[i]
+            self.ledger.remove_building(old, chunk.levels[i])
+            self.ledger.add_building(bid, chunk.levels[i])
+            was_used = bool(chunk.terrains[i] or old)
+            chunk.buildings[i] = bid
+            chunk.built += bool(bid) - bool(old)
+            chunk.index = None
+            self._settle(key, chunk, i, was_used)
+        self.version += 1
+        if bid == CHEST_ID:
+            if (x, y) not in self.slots:
+                self.slots[(x, y)] = self._alloc_slot()
+        elif (x, y) in self.slots:
+            slot = self.slots.pop((x, y))
+            base = slot * NUM_RESOURCES
+            for r in range(NUM_RESOURCES):
+                self.ledger.stock[r] -= self.stock[base + r]
+            self._free_slots.append(slot)
+        self._changed(x, y)
+
+    def set_level(self, x: int, y: int, lvl: int):
+        # levels of empty cells are never read (placing resets them), so
+        # they don't get a chunk of their own
+        _, chunk, i = self._cell(x, y, False)
+        if chunk is not None:
+            self.ledger.remove_building(chunk.buildings[i], chunk.levels[i])
+            self.ledger.add_building(chunk.buildings[i], lvl)
+            chunk.levels[i] = lvl
+        self.version += 1
+        self._changed(x, y)
+
+    def reindex(self):
+        """
+        Rebuild the ledger, free chest slots and network index from the
+        chunks, e.g. after they were filled in from a save file.
+        """
+        ledger = Ledger()
+        counts = Counter((bid, lvl) for _, _, bid, lvl in self.occupied())
+        for (bid, lvl), count in counts.items():
+            ledger.add_building(bid, lvl, count)
+        used = set(self.slots.values())
+        for slot in used:
+            base = slot * NUM_RESOURCES
+            for r in range(NUM_RESOURCES):
+                ledger.stock[r] += self.stock[base + r]
+        self.ledger = ledger
+        self._free_slots = [
+            s for s in range(len(self.stock) // NUM_RESOURCES) if s not in used
         ]
-        for _ in range(height)
-    ]
+        self.version += 1
+        self.network.rebuild()
 
+    def _changed(self, x: int, y: int):
+        for listener in self.listeners:
+            listener(x, y)
 
-def update_tile(world_grid, x: int, y: int, b: Building):
-    cell = world_grid[y][x]
-    cell["building"] = b
-    cell["level"] = 1
+    def _alloc_slot(self) -> int:
+        if self._free_slots:
+            slot = self._free_slots.pop()
+            base = slot * NUM_RESOURCES
+            for r in range(NUM_RESOURCES):
+                self.stock[base + r] = 0
+            return slot
+        slot = len(self.stock) // NUM_RESOURCES
+        if not isinstance(self.stock, array):
+            # a buffer lent by parallel.ParallelTicker, which can't grow
+            stock = array("q")
+            stock.frombytes(memoryview(self.stock).cast("B"))
+            self.stock = stock
+        self.stock.extend([0] * NUM_RESOURCES)
+        return slot
 
 
-def place_terrain(world_grid, x: int, y: int, terrain_key: str):
+def init_world(width: int, height: int) -> Grid:
+    """
+    Create a height X width grid of 'base' terrain with no buildings.
+    """
+    return Grid(width, height)
+
+
+def update_tile(world_grid: Grid, x: int, y: int, b: Building):
+    world_grid.set_building(x, y, b)
+    world_grid.set_level(x, y, 1)
+    world_grid.network.invalidate(x, y)
+
+
+def erase_tile(world_grid: Grid, x: int, y: int):
+    if world_grid.building_id(x, y):
+        world_grid.set_building(x, y, None)
+        world_grid.network.invalidate(x, y)
+
+
+def place_building(world_grid: Grid, x: int, y: int, b: Building) -> bool:
+    """
+    update_tile, but only if b is allowed on the tile's terrain.
+    """
+    if not allows(b.id, world_grid.terrain_code(x, y)):
+        return False
+    update_tile(world_grid, x, y, b)
+    return True
+
+
+def place_terrain(world_grid: Grid, x: int, y: int, terrain_key: str):
     """
     Paint a terrain type—and if an existing building
     isn't allowed on it, remove that building.
     """
-    cell = world_grid[y][x]
-    cell["terrain"] = terrain_key
-    bld = cell["building"]
-    if bld and terrain_key not in bld.allowed_terrains:
-        cell["building"] = None
+    world_grid.set_terrain(x, y, terrain_key)
+    bid = world_grid.building_id(x, y)
+    if bid and not allows(bid, TERRAIN_CODES[terrain_key]):
+        world_grid.set_building(x, y, None)
+        world_grid.network.invalidate(x, y)
 
 
-def upgrade_tile(world_grid, x, y):
-    cell = world_grid[y][x]
-    cell["level"] += 1
+def place_buildings(world_grid: Grid, cells: Iterable[Pos], b: Building) -> int:
+    """
+    place_building on every cell, as one batch. Returns how many were
+    placed.
+    """
+    with world_grid.batch():
+        return sum(place_building(world_grid, x, y, b) for x, y in cells)
+
+
+def place_terrains(world_grid: Grid, cells: Iterable[Pos], terrain_key: str):
+    """
+    place_terrain on every cell, as one batch.
+    """
+    with world_grid.batch():
+        for x, y in cells:
+            place_terrain(world_grid, x, y, terrain_key)
 
 
-def simulate_tick(world_grid):
-    H = len(world_grid)
-    W = len(world_grid[0]) if H else 0
+def erase_tiles(world_grid: Grid, cells: Iterable[Pos]):
+    """
+    erase_tile on every cell, as one batch.
+    """
+    with world_grid.batch():
+        for x, y in cells:
+            erase_tile(world_grid, x, y)
 
-    for y in range(H):
-        for x in range(W):
-            cell = world_grid[y][x]
-            bld = cell["building"]
-            lvl = cell["level"]
-            if not bld or not bld.outputs:
+
+def rect_cells(x0: int, y0: int, x1: int, y1: int) -> List[Pos]:
+    """
+    Cells of the rectangle with corners (x0, y0) and (x1, y1), inclusive,
+    in row-major order.
+    """
+    xs = range(min(x0, x1), max(x0, x1) + 1)
+    return [(x, y) for y in range(min(y0, y1), max(y0, y1) + 1) for x in xs]
+
+
+def flood_cells(view: GridView, x: int, y: int, limit: int = 0) -> List[Pos]:
+    """
+    The 4-connected region around (x, y) with the same terrain and
+    building, within the world's bounds; at most `limit` cells if given.
+    """
+    if not view.in_bounds(x, y):
+        return []
+    match = (view.terrain_code(x, y), view.building_id(x, y))
+    seen = {(x, y)}
+    queue = deque(seen)
+    while queue:
+        cx, cy = queue.popleft()
+        for nx, ny in ((cx + 1, cy), (cx - 1, cy), (cx, cy + 1), (cx, cy - 1)):
+            if (nx, ny) in seen or not view.in_bounds(nx, ny):
                 continue
+            if (view.terrain_code(nx, ny), view.building_id(nx, ny)) == match:
+                seen.add((nx, ny))
+                queue.append((nx, ny))
+                if len(seen) == limit:
+                    queue.clear()
+                    break
+    return sorted(seen, key=lambda p: (p[1], p[0]))
+
+
+def upgrade_tile(world_grid: Grid, x, y):
+    # Levels don't change connectivity, so the network index is untouched.
+    world_grid.set_level(x, y, world_grid.level(x, y) + 1)
+
+
+def chest_offsets(world_grid: GridView, x: int, y: int) -> List[int]:
+    """
+    Offsets into `stock` of the chests the producer at (x, y) reaches, in
+    the order it tries them.
+    """
+    return [
+        world_grid.chest_slot(cx, cy)
+        for cx, cy in world_grid.network.reachable_chests(x, y)
+    ]
+
+
+def producer_links(world_grid: GridView) -> Iterator[Tuple[int, int, int, int, list]]:
+    """
+    (x, y, building id, level, chest offsets) of every producer with a
+    reachable chest, in tick order.
+    """
+    for x, y, bid, lvl in world_grid.occupied():
+        if ROLES[bid] & ROLE_PRODUCER:
+            offs = chest_offsets(world_grid, x, y)
+            if offs:
+                yield x, y, bid, lvl, offs
+
+
+def recipe(bid: int, lvl: int) -> Tuple[list, list]:
+    """
+    Inputs and outputs of one firing of `bid` at level `lvl`, each as
+    (resource index, amount).
+    """
+    scale = 2 ** (lvl - 1)
+    return (
+        [(r, req * lvl) for r, req in INPUTS[bid]],
+        [(r, amt * scale) for r, amt in OUTPUTS[bid]],
+    )
+
+
+def affordable(bid: int, lvl: int, offsets, stock) -> int:
+    """
+    Offset of the first of `offsets` whose chest holds all of producer
+    `bid`'s inputs, or -1.
+    """
+    inputs = INPUTS[bid]
+    for base in offsets:
+        if all(stock[base + r] >= req * lvl for r, req in inputs):
+            return base
+    return -1
+
+
+def deposit(bid: int, lvl: int, base: int, stock, totals):
+    """
+    Pay for one firing of producer `bid` from the chest at `base` and put
+    the output in it.
+    """
+    for r, req in INPUTS[bid]:
+        stock[base + r] -= req * lvl
+        totals[r] -= req * lvl
+    scale = 2 ** (lvl - 1)
+    for r, prod in OUTPUTS[bid]:
+        stock[base + r] += prod * scale
+        totals[r] += prod * scale
+
+
+def produce(bid: int, lvl: int, offsets, stock, totals) -> bool:
+    """
+    Run producer `bid` against its reachable chests, given as offsets into
+    `stock`: the first chest holding all inputs pays for them and receives
+    the output. Returns whether it fired.
+    """
+    base = affordable(bid, lvl, offsets, stock)
+    if base < 0:
+        return False
+    deposit(bid, lvl, base, stock, totals)  # only produce once per tick
+    return True
+
+
+def used_chests(bid: int, offsets: List[int]) -> List[int]:
+    """
+    The chest offsets producer `bid` can ever touch out of those it
+    reaches. One without inputs can always afford the first chest, so it
+    never gets past it.
+    """
+    return offsets if ROLES[bid] & ROLE_CONSUMER else offsets[:1]
+
+
+def split_shards(items: list, offsets: Callable[[object], List[int]]) -> List[list]:
+    """
+    Group items into shards whose chest offsets don't overlap, each in
+    the order given. Items without any chest share one shard of their own.
+    """
+    parent: Dict[int, int] = {}
+
+    def find(a: int) -> int:
+        while parent.setdefault(a, a) != a:
+            parent[a] = parent[parent[a]]
+            a = parent[a]
+        return a
+
+    for item in items:
+        offs = offsets(item)
+        if offs:
+            root = find(offs[0])
+            for off in offs[1:]:
+                parent[find(off)] = root
+    shards: Dict[int, list] = {}
+    for item in items:
+        offs = offsets(item)
+        shards.setdefault(find(offs[0]) if offs else -1, []).append(item)
+    return list(shards.values())
+
+
+def simulate_tick(world_grid: Grid):
+    """
+    Fire every producer once, in row-major order. While profiling, the
+    time spent finding chests, checking inputs and depositing is summed
+    over the tick and recorded as three phases laid end to end inside the
+    tick's span.
+    """
+    timed = profiler.enabled
+    clock = time.perf_counter
+    t0 = clock() if timed else 0.0
+    reach_s = check_s = deposit_s = 0.0
+    stock, totals = world_grid.stock, world_grid.ledger.stock
+    for x, y, bid, lvl in world_grid.occupied():
+        if not ROLES[bid] & ROLE_PRODUCER:
+            continue
+        if not timed:
+            produce(bid, lvl, chest_offsets(world_grid, x, y), stock, totals)
+            continue
 
-            # Step 1: Find reachable chimp chests
-            visited = set()
-            queue = [(x, y)]
-            reachable_chests = []
-
-            while queue:
-                cx, cy = queue.pop(0)
-                if (cx, cy) in visited:
-                    continue
-                visited.add((cx, cy))
-
-                for dx, dy in [(0, 1), (1, 0), (-1, 0), (0, -1)]:
-                    nx, ny = cx + dx, cy + dy
-                    if not (0 <= nx < W and 0 <= ny < H):
-                        continue
-                    neighbor = world_grid[ny][nx]
-                    nbld = neighbor["building"]
-
-                    if (nx, ny) in visited:
-                        continue
-                    if nbld:
-                        if nbld.name == "Chimp Chest":
-                            reachable_chests.append((nx, ny))
-                        elif nbld.name == "Conveyer Belt":
-                            queue.append((nx, ny))
-
-            # Step 2: Check if all inputs are available in any single chimp chest
-            for chest_x, chest_y in reachable_chests:
-                chest = world_grid[chest_y][chest_x]
-                inventory = chest["inventory"]
-                if all(inventory[res] >= req * lvl for res, req in bld.inputs.items()):
-                    # Step 3: Deduct from chest
-                    for res, req in bld.inputs.items():
-                        inventory[res] -= req * lvl
-
-                    # Step 4: Produce + deposit output
-                    for res, prod in bld.outputs.items():
-                        amount = prod * (2 ** (lvl - 1))
-                        chest["inventory"][res] += amount
-                    break  # only produce once per tick
+        # Look up reachable chimp chests, then fire into the first one
+        # that can afford the inputs
+        a = clock()
+        offsets = chest_offsets(world_grid, x, y)
+        b = clock()
+        base = affordable(bid, lvl, offsets, stock)
+        c = clock()
+        if base >= 0:
+            deposit(bid, lvl, base, stock, totals)
+        d = clock()
+        reach_s += b - a
+        check_s += c - b
+        deposit_s += d - c
+    if timed:
+        profiler.record("tick.reachability", t0, reach_s)
+        profiler.record("tick.inputs", t0 + reach_s, check_s)
+        profiler.record("tick.deposit", t0 + reach_s + check_s, deposit_s)
+        profiler.record("simulate_tick", t0, clock() - t0)